@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse
+from contextlib import redirect_stdout
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+
+from file_parser import parse_single_file
+from database import (create_database, save_to_database, update_database_with_mapping,
+                      database_session)
+from synthetic_rassi import (generate_scan, scan_distances, DEFAULT_STATES, DEFAULT_JOBIPH,
+                             DEFAULT_TRANSITIONS)
+import plotter
+import symmetry_plotter
+
+# Historia wyników (jedna linia JSON na uruchomienie i konfigurację)
+HISTORY_FILE = "benchmark_history.jsonl"
+STAGES = ("parse", "save_to_database", "update_database_with_mapping",
+          "plot_state_energies", "symmetry_plotter")
+BATCH_SIZE = 32
+
+def git_revision():
+    """Bieżący commit i informacja, czy drzewo robocze ma niezatwierdzone zmiany."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                cwd=repo, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def machine_info():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__, 'machine': platform.machine(),
+            'system': platform.system(), 'cpus': os.cpu_count()}
+
+def run_benchmark(n_distances, n_states, n_jobiph=DEFAULT_JOBIPH,
+                  n_transitions=DEFAULT_TRANSITIONS, work_dir=None, batch_size=BATCH_SIZE,
+                  dpi=100, plots=True, seed=0):
+    """Generuje syntetyczny skan i mierzy czasy kolejnych etapów potoku.
+
+    Parsowanie i zapis idą partiami po batch_size plików (jak w main.py),
+    więc pamięć nie rośnie z liczbą geometrii. Zwraca (czasy, liczniki).
+    """
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="praca_bench_")
+    data_dir = os.path.join(work_dir, "dane")
+    db_name = os.path.join(work_dir, "bench.db")
+    if os.path.exists(db_name):
+        os.remove(db_name)
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    counts = {}
+    try:
+        start = time.perf_counter()
+        paths = generate_scan(data_dir, scan_distances(n_distances), n_states, n_jobiph,
+                              n_transitions, seed)
+        counts['generate_s'] = time.perf_counter() - start
+        counts['files'] = len(paths)
+        counts['bytes'] = sum(os.path.getsize(p) for p in paths)
+
+        create_database(db_name)
+        rows = 0
+        with database_session(db_name):
+            for first in range(0, len(paths), batch_size):
+                start = time.perf_counter()
+                batch = [parse_single_file(p) for p in paths[first:first + batch_size]]
+                timings['parse'] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                rows += save_to_database(batch, db_name)
+                timings['save_to_database'] += time.perf_counter() - start
+            counts['rows'] = rows
+
+            start = time.perf_counter()
+            update_database_with_mapping(db_name)
+            timings['update_database_with_mapping'] = time.perf_counter() - start
+
+        if plots:
+            # Wykresy wypisują skalę osi itp. – w pomiarze niepotrzebne
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                start = time.perf_counter()
+                plotter.plot_state_energies(states_to_plot=list(range(1, n_states + 1)),
+                                            save_path=os.path.join(work_dir, "state_energies.png"),
+                                            show=False, dpi=dpi, db_path=db_name)
+                timings['plot_state_energies'] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                symmetry_plotter.main(db_name, os.path.join(work_dir, "energy_curves"),
+                                      formats=("png",), headless=True, dpi=dpi)
+                timings['symmetry_plotter'] = time.perf_counter() - start
+        else:
+            del timings['plot_state_energies'], timings['symmetry_plotter']
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return timings, counts
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_entry(history, config):
+    """Ostatni zapisany wynik dla tej samej konfiguracji (albo None)."""
+    for entry in reversed(history):
+        if entry['config'] == config:
+            return entry
+    return None
+
+def print_comparison(config, timings, previous):
+    print(f"\nGeometrie: {config['distances']}, stany: {config['states']}, "
+          f"przejścia: {config['transitions']}")
+    if previous is not None:
+        commit = (previous.get('commit') or '?')[:10]
+        print(f"Porównanie z {commit} ({previous['timestamp']})")
+    print(f"{'etap':<30} {'czas [s]':>10} {'poprzednio':>11} {'zmiana':>8}")
+    slowdown = 0.0
+    for stage, seconds in timings.items():
+        before = previous['timings'].get(stage) if previous else None
+        if before:
+            ratio = seconds / before
+            slowdown = max(slowdown, ratio)
+            print(f"{stage:<30} {seconds:10.3f} {before:11.3f} {ratio:7.2f}x")
+        else:
+            print(f"{stage:<30} {seconds:10.3f} {'-':>11} {'-':>8}")
+    return slowdown
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark potoku na syntetycznych wyjściach RASSI")
+    parser.add_argument("--distances", type=int, nargs='+', default=[45],
+                        help="liczby geometrii (każda kombinacja z --states to osobny pomiar)")
+    parser.add_argument("--states", type=int, nargs='+', default=[DEFAULT_STATES])
+    parser.add_argument("--jobiph", type=int, default=DEFAULT_JOBIPH)
+    parser.add_argument("--transitions", type=int, default=DEFAULT_TRANSITIONS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="liczba powtórzeń (zapisywany jest najlepszy czas)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--no-plots", action="store_true", help="pomija etapy wykresów")
+    parser.add_argument("--work-dir", help="folder roboczy (domyślnie tymczasowy)")
+    parser.add_argument("--history", default=HISTORY_FILE, help="plik historii wyników")
+    parser.add_argument("--no-save", action="store_true", help="nie dopisuje do historii")
+    parser.add_argument("--max-slowdown", type=float,
+                        help="kod wyjścia 1, gdy któryś etap jest wolniejszy o ten czynnik")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    history = load_history(args.history)
+    commit, dirty = git_revision()
+    worst = 0.0
+
+    for n_distances in args.distances:
+        for n_states in args.states:
+            config = {'distances': n_distances, 'states': n_states, 'jobiph': args.jobiph,
+                      'transitions': args.transitions, 'batch_size': args.batch_size,
+                      'dpi': args.dpi, 'plots': not args.no_plots}
+            best = None
+            for _ in range(args.repeat):
+                timings, counts = run_benchmark(n_distances, n_states, args.jobiph,
+                                                args.transitions, args.work_dir,
+                                                args.batch_size, args.dpi, not args.no_plots)
+                best = timings if best is None else {k: min(v, timings[k])
+                                                     for k, v in best.items()}
+
+            worst = max(worst, print_comparison(config, best, previous_entry(history, config)))
+            entry = {'commit': commit, 'dirty': dirty,
+                     'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     'machine': machine_info(), 'config': config,
+                     'timings': best, 'counts': counts}
+            history.append(entry)
+            if not args.no_save:
+                with open(args.history, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    if args.max_slowdown is not None and worst > args.max_slowdown:
+        print(f"\nRegresja: etap wolniejszy {worst:.2f}x (próg {args.max_slowdown}x)")
+        sys.exit(1)
@@ -0,0 +1,202 @@
+import numpy as np
+from pes_scan import PESScan
+from database import save_crossings, fetch_crossings
+from state_tracking import symmetry_codes
+
+# Największa przerwa w lokalnym minimum, przy której para tej samej symetrii
+# jest uznawana za unikane przecięcie (Hartree, ~0.27 eV)
+AVOIDED_GAP_THRESHOLD = 0.01
+# Minimum przerwy musi być wyraźne: przerwa rośnie po obu stronach węzła o co
+# najmniej max(AVOIDED_MIN_RISE, AVOIDED_RISE_FRACTION · przerwa); płaskie
+# przerwy asymptotyczne mają lokalne minima tylko z szumu numerycznego (~1e-8 Hartree)
+AVOIDED_MIN_RISE = 1e-5
+AVOIDED_RISE_FRACTION = 0.005
+# Stany różniące się mniej są zdegenerowane (np. składowe Π); zmiana znaku
+# różnicy takich energii to szum numeryczny, a nie przecięcie (Hartree)
+DEGENERACY_TOLERANCE = 1e-6
+# Liczba par stanów analizowanych naraz (ogranicza pamięć przy setkach stanów)
+PAIR_CHUNK = 8192
+CROSSING_FIELDS = ('state_a', 'state_b', 'kind', 'distance', 'distance_left',
+                   'distance_right', 'energy', 'gap')
+# Styl znaczników przecięć na wykresach
+CROSSING_MARKERS = {
+    'true': dict(marker='x', color='black', label='Przecięcie (różna symetria)'),
+    'avoided': dict(marker='o', facecolors='none', edgecolors='magenta',
+                    label='Przecięcie unikane (ta sama symetria)'),
+}
+
+def _sign_changes(d, energies, diff, same, a, b, tolerance):
+    """Zmiany znaku E_a − E_b między sąsiednimi punktami siatki.
+
+    Położenie i energię przecięcia daje interpolacja liniowa. Para o różnej
+    symetrii to przecięcie prawdziwe (gap = 0); para tej samej symetrii
+    nie może się przeciąć, więc to nierozdzielone przez siatkę przecięcie
+    unikane (gap nieznany).
+    """
+    crossing = diff[:-1] * diff[1:] < 0
+    crossing &= np.maximum(np.abs(diff[:-1]), np.abs(diff[1:])) >= tolerance
+    rows, cols = np.nonzero(crossing)
+    t = diff[rows, cols] / (diff[rows, cols] - diff[rows + 1, cols])
+    location = d[rows] + t * (d[rows + 1] - d[rows])
+    e0, e1 = energies[rows, a[cols]], energies[rows + 1, a[cols]]
+    same_symmetry = same[rows, cols] & same[rows + 1, cols]
+    return {
+        'state_a': a[cols], 'state_b': b[cols],
+        'kind': np.where(same_symmetry, 'avoided', 'true'),
+        'distance': location, 'distance_left': d[rows], 'distance_right': d[rows + 1],
+        'energy': e0 + t * (e1 - e0),
+        'gap': np.where(same_symmetry, np.nan, 0.0),
+    }
+
+def _gap_minima(d, energies, diff, same, a, b, gap_threshold, min_rise=AVOIDED_MIN_RISE,
+                rise_fraction=AVOIDED_RISE_FRACTION):
+    """Wyraźne lokalne minima |E_a − E_b| poniżej progu dla par tej samej symetrii.
+
+    Przerwa musi rosnąć po obu stronach węzła o co najmniej
+    max(min_rise, rise_fraction · przerwa w węźle). Minimum i jego
+    położenie szacuje parabola przez trzy punkty wokół węzła.
+    """
+    gap = np.abs(diff)
+    center = gap[1:-1]
+    rise = np.minimum(gap[:-2], gap[2:]) - center
+    mask = (rise >= np.maximum(min_rise, rise_fraction * center)) & (center < gap_threshold)
+    mask &= (diff[:-2] * diff[1:-1] > 0) & (diff[1:-1] * diff[2:] > 0)
+    mask &= same[:-2] & same[1:-1] & same[2:]
+    rows, cols = np.nonzero(mask)
+    rows += 1
+
+    x0, x1, x2 = d[rows - 1], d[rows], d[rows + 1]
+    g0, g1, g2 = gap[rows - 1, cols], gap[rows, cols], gap[rows + 1, cols]
+    f01 = (g1 - g0) / (x1 - x0)
+    f012 = ((g2 - g1) / (x2 - x1) - f01) / (x2 - x0)   # > 0 w ścisłym minimum
+    vertex = np.clip((x0 + x1) / 2 - f01 / (2 * f012), x0, x2)
+    min_gap = np.clip(g0 + f01 * (vertex - x0) + f012 * (vertex - x0) * (vertex - x1), 0, g1)
+
+    # Energia przecięcia: średnia obu stanów interpolowana w przedziale z wierzchołkiem
+    left = vertex < x1
+    lo = np.where(left, rows - 1, rows)
+    mean = (energies[:, a[cols]] + energies[:, b[cols]]) / 2
+    m_lo, m_hi = mean[lo, np.arange(len(cols))], mean[lo + 1, np.arange(len(cols))]
+    t = (vertex - d[lo]) / (d[lo + 1] - d[lo])
+    return {
+        'state_a': a[cols], 'state_b': b[cols],
+        'kind': np.full(len(rows), 'avoided'),
+        'distance': vertex, 'distance_left': d[lo], 'distance_right': d[lo + 1],
+        'energy': m_lo + t * (m_hi - m_lo),
+        'gap': min_gap,
+    }
+
+def detect_crossings(scan: PESScan, gap_threshold=AVOIDED_GAP_THRESHOLD,
+                     tolerance=DEGENERACY_TOLERANCE, pair_chunk=PAIR_CHUNK,
+                     min_rise=AVOIDED_MIN_RISE, rise_fraction=AVOIDED_RISE_FRACTION):
+    """Przecięcia wszystkich par stanów w skanie, wykrywane operacjami na tablicach.
+
+    Dla każdej pary stanów (a < b) liczona jest różnica E_a − E_b we
+    wszystkich odległościach naraz (pary przetwarzane porcjami po
+    pair_chunk). Symetria to (irrep, multipletowość, Abs_M) z tabeli
+    calculations; pary zdegenerowane (|ΔE| < tolerance) są pomijane,
+    a minima przerwy muszą być wyraźne (min_rise, rise_fraction).
+    Zwraca słownik tablic CROSSING_FIELDS posortowany wg odległości;
+    numery stanów to numery RASSI.
+    """
+    d = scan.distances
+    codes = symmetry_codes(scan)
+    abs_m = np.nan_to_num(scan.abs_m, nan=-1.0)
+    pairs_a, pairs_b = np.triu_indices(scan.n_states, k=1)
+
+    parts = []
+    for start in range(0, len(pairs_a), pair_chunk):
+        a, b = pairs_a[start:start + pair_chunk], pairs_b[start:start + pair_chunk]
+        diff = scan.energies[:, a] - scan.energies[:, b]
+        same = (codes[:, a] == codes[:, b]) & (abs_m[:, a] == abs_m[:, b])
+        parts.append(_sign_changes(d, scan.energies, diff, same, a, b, tolerance))
+        if scan.n_distances >= 3:
+            parts.append(_gap_minima(d, scan.energies, diff, same, a, b, gap_threshold,
+                                     min_rise, rise_fraction))
+
+    crossings = {field: np.concatenate([part[field] for part in parts])
+                 if parts else np.empty(0) for field in CROSSING_FIELDS}
+    crossings['state_a'] = scan.state_nums[crossings['state_a'].astype(np.int64)]
+    crossings['state_b'] = scan.state_nums[crossings['state_b'].astype(np.int64)]
+    order = np.argsort(crossings['distance'], kind='stable')
+    return {field: values[order] for field, values in crossings.items()}
+
+def flat_gap_minima(crossings, scan: PESScan, min_rise=AVOIDED_MIN_RISE):
+    """Indeksy przecięć unikanych, przy których przerwa pary nigdzie nie rośnie.
+
+    Kontrola niezależna od kryterium lokalnego w _gap_minima: przerwa pary
+    w całym skanie musi po obu stronach minimum przekroczyć przerwę
+    w minimum o min_rise. Płaskie przerwy asymptotyczne (minima z szumu)
+    nie spełniają tego warunku; pusta lista oznacza poprawny wynik.
+    """
+    flat = []
+    columns = {state: i for i, state in enumerate(scan.state_nums.tolist())}
+    resolved = np.flatnonzero((crossings['kind'] == 'avoided') & ~np.isnan(crossings['gap']))
+    for i in resolved.tolist():
+        a, b = columns[crossings['state_a'][i]], columns[crossings['state_b'][i]]
+        gap = np.abs(scan.energies[:, a] - scan.energies[:, b])
+        left = gap[scan.distances <= crossings['distance_left'][i]]
+        right = gap[scan.distances >= crossings['distance_right'][i]]
+        if min(np.nanmax(left), np.nanmax(right)) - crossings['gap'][i] < min_rise:
+            flat.append(i)
+    return flat
+
+def update_crossings(db_name="molcas_results.db", gap_threshold=AVOIDED_GAP_THRESHOLD):
+    """Wykrywa przecięcia w skanie z bazy i zapisuje je w tabeli crossings."""
+    crossings = detect_crossings(PESScan.from_database(db_name), gap_threshold)
+    save_crossings(crossings, db_name)
+    return crossings
+
+def load_crossings(db_name="molcas_results.db", kind=None):
+    """Tabela crossings jako słownik tablic (jak wynik detect_crossings)."""
+    rows = fetch_crossings(kind, db_name)
+    columns = list(zip(*rows)) if rows else [()] * len(CROSSING_FIELDS)
+    crossings = {field: np.array(values) for field, values in zip(CROSSING_FIELDS, columns)}
+    for field in ('distance', 'distance_left', 'distance_right', 'energy', 'gap'):
+        crossings[field] = np.array([np.nan if v is None else v for v in crossings[field]],
+                                    dtype=np.float64)
+    return crossings
+
+def plot_crossings(ax, crossings, states=None):
+    """Nanosi przecięcia na wykres energii (x – prawdziwe, o – unikane).
+
+    Przy podanych states rysowane są tylko przecięcia par z tej listy.
+    Zwraca narysowane obiekty (do legendy).
+    """
+    artists = []
+    for kind, style in CROSSING_MARKERS.items():
+        mask = crossings['kind'] == kind
+        if states is not None:
+            mask &= np.isin(crossings['state_a'], states) & np.isin(crossings['state_b'], states)
+        if mask.any():
+            artists.append(ax.scatter(crossings['distance'][mask], crossings['energy'][mask],
+                                      s=30, linewidths=1.0, zorder=3, **style))
+    return artists
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Wykrywanie przecięć krzywych energii")
+    parser.add_argument("--db", default="molcas_results.db")
+    parser.add_argument("--gap-threshold", type=float, default=AVOIDED_GAP_THRESHOLD,
+                        help="maksymalna przerwa przecięcia unikanego (Hartree)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="ile przecięć unikanych o najmniejszej przerwie wypisać")
+    parser.add_argument("--check", action="store_true",
+                        help="kontrola regresji: błąd, gdy przecięcie unikane leży na płaskiej przerwie")
+    args = parser.parse_args()
+
+    crossings = update_crossings(args.db, args.gap_threshold)
+    true = crossings['kind'] == 'true'
+    print(f"Przecięcia prawdziwe: {int(true.sum())}, unikane: {int((~true).sum())}")
+    resolved = np.flatnonzero(~true & ~np.isnan(crossings['gap']))
+    for i in resolved[np.argsort(crossings['gap'][resolved])][:args.top]:
+        print(f"  stany {crossings['state_a'][i]:3d}–{crossings['state_b'][i]:<3d} "
+              f"R = {crossings['distance'][i]:.4f} Å, przerwa {crossings['gap'][i] * 1000:.3f} mHa")
+    if args.check:
+        flat = flat_gap_minima(crossings, PESScan.from_database(args.db))
+        for i in flat:
+            print(f"  PŁASKA PRZERWA: stany {crossings['state_a'][i]}–{crossings['state_b'][i]} "
+                  f"R = {crossings['distance'][i]:.4f} Å")
+        if flat:
+            raise SystemExit(f"Kontrola nieudana: {len(flat)} przecięć unikanych bez wyraźnego minimum")
+        print("Kontrola: brak przecięć unikanych na płaskich przerwach")
@@ -1,9 +1,84 @@
+import os
+import logging
 import sqlite3
+from contextlib import contextmanager
 from typing import List, Dict
 
+logger = logging.getLogger(__name__)
+
+# Parametry połączeń: WAL pozwala czytelnikom (np. wykresom) działać w trakcie
+# zapisu, cache_size w KiB (wartość ujemna), mmap_size w bajtach
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS = "NORMAL"
+CACHE_SIZE = -65536
+MMAP_SIZE = 256 * 1024 * 1024
+# Rozmiar cache przygotowanych zapytań w każdym połączeniu
+CACHED_STATEMENTS = 256
+# Czas oczekiwania na blokadę zapisu [s]
+BUSY_TIMEOUT = 30.0
+
+# Otwarte sesje: ścieżka bazy → współdzielone połączenie
+_sessions = {}
+
+def apply_pragmas(conn, journal_mode=None, synchronous=None, cache_size=None, mmap_size=None):
+    """Ustawia opcjonalne pragmy SQLite (np. journal_mode='WAL', synchronous='NORMAL')."""
+    if journal_mode is not None:
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    if synchronous is not None:
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+    if cache_size is not None:
+        conn.execute(f"PRAGMA cache_size={int(cache_size)}")
+    if mmap_size is not None:
+        conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+def connect(db_name="molcas_results.db", readonly=False, journal_mode=JOURNAL_MODE,
+            synchronous=SYNCHRONOUS, cache_size=CACHE_SIZE, mmap_size=MMAP_SIZE):
+    """Otwiera nowe połączenie z ustawionymi pragmami.
+
+    Połączenie tylko do odczytu nie zmienia trybu dziennika bazy
+    (query_only), więc może działać równolegle z zapisem w trybie WAL.
+    """
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+    if readonly:
+        apply_pragmas(conn, cache_size=cache_size, mmap_size=mmap_size)
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        apply_pragmas(conn, journal_mode, synchronous, cache_size, mmap_size)
+    return conn
+
+@contextmanager
+def database_session(db_name="molcas_results.db", **pragmas):
+    """Jedno połączenie współdzielone przez wszystkie funkcje modułu w bloku with.
+
+    Pragmy ustawiane są raz, a przygotowane zapytania pozostają w cache
+    połączenia między wywołaniami. Zagnieżdżona sesja tej samej bazy
+    używa istniejącego połączenia.
+    """
+    key = os.path.abspath(db_name)
+    if key in _sessions:
+        yield _sessions[key]
+        return
+    conn = connect(db_name, **pragmas)
+    _sessions[key] = conn
+    try:
+        yield conn
+    finally:
+        del _sessions[key]
+        conn.close()
+
+def open_connection(db_name="molcas_results.db", readonly=False):
+    """Połączenie otwartej sesji dla db_name albo nowe połączenie."""
+    conn = _sessions.get(os.path.abspath(db_name))
+    return conn if conn is not None else connect(db_name, readonly=readonly)
+
+def close_connection(conn):
+    """Zamyka połączenie, chyba że należy do otwartej sesji."""
+    if not any(conn is session for session in _sessions.values()):
+        conn.close()
+
 def create_database(db_name="molcas_results.db"):
     """Tworzy bazę danych z tabelą calculations."""
-    conn = sqlite3.connect(db_name)
+    conn = open_connection(db_name)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -21,69 +96,406 @@ def create_database(db_name="molcas_results.db"):
         irrep_index INTEGER
     )
     """)
-    
-    conn.commit()
-    conn.close()
 
-def save_to_database(results: List[Dict], db_name="molcas_results.db"):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
-    for result in results:
-        distance = result['distance']
-        
-        # Tworzymy mapę JOBIPH dla szybkiego dostępu
-        jobiph_map = {job['file']: job for job in result['jobiph_data']}
-        
-        for state, mappings in result['states_mapping'].items():
-            energy = result['energies'].get(state, None)
-            abs_m = result['abs_m'].get(state, None)
-            
-            for mapping in mappings:
-                jobiph_name = mapping['jobiph']
-                root = mapping['root']
-                
-                # Pobierz dane JOBIPH z mapy
-                jobiph_info = jobiph_map.get(jobiph_name)
-                
-                # Debugowanie
-                print(f"State {state}: JOBIPH={jobiph_name}, Root={root}, "
-                      f"Irrep={jobiph_info['irrep'] if jobiph_info else None}, "
-                      f"Mult={jobiph_info['multiplicity'] if jobiph_info else None}")
-                
-                cursor.execute("""
-                INSERT INTO calculations (
-                    distance, state_num, energy, abs_m, 
-                    jobiph, root, irrep, multiplicity
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    distance,
-                    state,
-                    energy,
-                    abs_m,
-                    jobiph_name,
-                    root,
-                    jobiph_info['irrep'] if jobiph_info else None,
-                    jobiph_info['multiplicity'] if jobiph_info else None
-                ))
+    # Indeksy pod mapowanie stanów i zapytania po symetrii
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_calculations_distance_state
+    ON calculations (distance, state_num)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_calculations_symmetry
+    ON calculations (distance, irrep, multiplicity, abs_m, energy)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_calculations_state
+    ON calculations (state_num)
+    """)
+
+    # Manifest wczytanych plików (do przyrostowego wczytywania)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS processed_files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        sha256 TEXT NOT NULL,
+        distance REAL NOT NULL,
+        processed_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Siły przejść (gauge: 'length', 'velocity', 'second_order')
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transitions (
+        distance REAL NOT NULL,
+        gauge TEXT NOT NULL,
+        from_state INTEGER NOT NULL,
+        to_state INTEGER NOT NULL,
+        osc_strength REAL NOT NULL,
+        ax REAL,
+        ay REAL,
+        az REAL,
+        a_total REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transitions_from
+    ON transitions (from_state, gauge, osc_strength)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transitions_distance
+    ON transitions (distance)
+    """)
+
+    # Porównanie sił oscylatora w cechowaniu długości i prędkości
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS gauge_comparison (
+        distance REAL NOT NULL,
+        from_state INTEGER NOT NULL,
+        to_state INTEGER NOT NULL,
+        difference REAL,
+        osc_length REAL,
+        osc_velocity REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_gauge_comparison_distance
+    ON gauge_comparison (distance, from_state)
+    """)
+
+    # Stałe spektroskopowe stanów (spectroscopy.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS spectroscopic_constants (
+        state_num INTEGER PRIMARY KEY,
+        r_e REAL,
+        e_min REAL,
+        d_e REAL,
+        omega_e REAL,
+        curvature REAL,
+        bound INTEGER NOT NULL
+    )
+    """)
+
+    # Identyfikatory krzywych ze śledzenia stanów (state_tracking.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS state_tracking (
+        distance REAL NOT NULL,
+        state_num INTEGER NOT NULL,
+        curve_id INTEGER NOT NULL,
+        PRIMARY KEY (distance, state_num)
+    )
+    """)
+
+    # Przecięcia krzywych energii (crossings.py); kind: 'avoided' lub 'true'
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS crossings (
+        state_a INTEGER NOT NULL,
+        state_b INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        distance REAL NOT NULL,
+        distance_left REAL NOT NULL,
+        distance_right REAL NOT NULL,
+        energy REAL,
+        gap REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_crossings_states
+    ON crossings (state_a, state_b)
+    """)
+
+    # Poziomy oscylacyjne stanów wiążących (vibrational.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS vibrational_levels (
+        state_num INTEGER NOT NULL,
+        v INTEGER NOT NULL,
+        order_index INTEGER,
+        energy REAL NOT NULL,
+        term_value REAL NOT NULL,
+        r_mean REAL,
+        PRIMARY KEY (state_num, v)
+    )
+    """)
     
     conn.commit()
-    conn.close()
+    close_connection(conn)
+
+INSERT_CALCULATION_SQL = """
+INSERT INTO calculations (
+    distance, state_num, energy, abs_m,
+    jobiph, root, irrep, multiplicity
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def iter_calculation_rows(result: Dict):
+    """Generator wierszy tabeli calculations dla wyników jednego pliku."""
+    distance = result['distance']
+    energies = result['energies']
+    abs_m_values = result['abs_m']
+
+    # Tworzymy mapę JOBIPH dla szybkiego dostępu
+    jobiph_map = {job['file']: (job['irrep'], job['multiplicity'])
+                  for job in result['jobiph_data']}
+
+    for state, mappings in result['states_mapping'].items():
+        energy = energies.get(state)
+        abs_m = abs_m_values.get(state)
+
+        for mapping in mappings:
+            jobiph_name = mapping['jobiph']
+            irrep, multiplicity = jobiph_map.get(jobiph_name, (None, None))
+            yield (distance, state, energy, abs_m,
+                   jobiph_name, mapping['root'], irrep, multiplicity)
+
+INSERT_TRANSITION_SQL = """
+INSERT INTO transitions (
+    distance, gauge, from_state, to_state, osc_strength, ax, ay, az, a_total
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_GAUGE_COMPARISON_SQL = """
+INSERT INTO gauge_comparison (
+    distance, from_state, to_state, difference, osc_length, osc_velocity
+) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+def _table_rows(distance, table, prefix=()):
+    """Wiersze do executemany z tablicy NumPy (NaN → NULL, numery stanów → int)."""
+    for values in table.tolist():
+        yield (distance, *prefix, int(values[0]), int(values[1]),
+               *(None if value != value else value for value in values[2:]))
+
+def iter_transition_rows(result: Dict):
+    """Generator wierszy tabeli transitions dla wyników jednego pliku."""
+    for gauge, table in result.get('transitions', {}).items():
+        yield from _table_rows(result['distance'], table, (gauge,))
+
+def iter_gauge_comparison_rows(result: Dict):
+    """Generator wierszy tabeli gauge_comparison dla wyników jednego pliku."""
+    table = result.get('gauge_comparison')
+    if table is not None:
+        yield from _table_rows(result['distance'], table)
+
+UPSERT_MANIFEST_SQL = """
+INSERT INTO processed_files (path, size, mtime, sha256, distance)
+VALUES (:path, :size, :mtime, :sha256, :distance)
+ON CONFLICT (path) DO UPDATE SET
+    size = excluded.size,
+    mtime = excluded.mtime,
+    sha256 = excluded.sha256,
+    distance = excluded.distance,
+    processed_at = CURRENT_TIMESTAMP
+"""
+
+def save_to_database(results: List[Dict], db_name="molcas_results.db",
+                     journal_mode=None, synchronous=None):
+    """Zapisuje wyniki wszystkich plików jednym executemany w jednej transakcji.
+
+    Wyniki z kluczem 'source' (odcisk pliku z file_fingerprint) zastępują
+    wcześniejsze wiersze tej samej odległości i są wpisywane do manifestu.
+    Zwraca liczbę wstawionych wierszy calculations.
+    """
+    results = list(results)
+    sources = [dict(result['source'], distance=result['distance'])
+               for result in results if 'source' in result]
+
+    conn = open_connection(db_name)
+    try:
+        apply_pragmas(conn, journal_mode, synchronous)
+        rows = (row for result in results for row in iter_calculation_rows(result))
+        transition_rows = (row for result in results for row in iter_transition_rows(result))
+        comparison_rows = (row for result in results
+                           for row in iter_gauge_comparison_rows(result))
+        replaced = [(source['distance'],) for source in sources]
+        with conn:
+            for table in ("calculations", "transitions", "gauge_comparison"):
+                conn.executemany(f"DELETE FROM {table} WHERE distance = ?", replaced)
+            inserted = conn.executemany(INSERT_CALCULATION_SQL, rows).rowcount
+            transitions = conn.executemany(INSERT_TRANSITION_SQL, transition_rows).rowcount
+            conn.executemany(INSERT_GAUGE_COMPARISON_SQL, comparison_rows)
+            conn.executemany(UPSERT_MANIFEST_SQL, sources)
+        logger.info("Zapisano %d plików: %d wierszy calculations, %d przejść",
+                    len(results), inserted, transitions,
+                    extra={'files': len(results), 'rows': inserted, 'transitions': transitions})
+    finally:
+        close_connection(conn)
+    return inserted
+
+def fetch_transitions(from_state=None, min_osc=0.0, gauge='length',
+                      db_name="molcas_results.db"):
+    """Przejścia (distance, from, to, osc, Ax, Ay, Az, A_total) w całym skanie.
+
+    Np. wszystkie przejścia ze stanu 1 o sile oscylatora co najmniej 1e-4:
+    fetch_transitions(1, 1e-4).
+    """
+    query = """
+    SELECT distance, from_state, to_state, osc_strength, ax, ay, az, a_total
+    FROM transitions
+    WHERE gauge = ? AND osc_strength >= ?
+    """
+    params = [gauge, min_osc]
+    if from_state is not None:
+        query += " AND from_state = ?"
+        params.append(from_state)
+    query += " ORDER BY distance, from_state, to_state"
+
+    conn = open_connection(db_name, readonly=True)
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        close_connection(conn)
+
+def load_manifest(db_name="molcas_results.db"):
+    """Zwraca manifest wczytanych plików: {path: (size, mtime, sha256)}."""
+    conn = open_connection(db_name, readonly=True)
+    try:
+        rows = conn.execute("SELECT path, size, mtime, sha256 FROM processed_files").fetchall()
+    finally:
+        close_connection(conn)
+    return {path: (size, mtime, sha256) for path, size, mtime, sha256 in rows}
+
+def load_manifest_distances(db_name="molcas_results.db"):
+    """Zwraca odległości wczytanych plików: {path: distance}."""
+    conn = open_connection(db_name, readonly=True)
+    try:
+        rows = conn.execute("SELECT path, distance FROM processed_files").fetchall()
+    finally:
+        close_connection(conn)
+    return dict(rows)
+
+def touch_manifest(fingerprints: List[Dict], db_name="molcas_results.db"):
+    """Aktualizuje rozmiar i mtime plików, których zawartość się nie zmieniła."""
+    conn = open_connection(db_name)
+    try:
+        with conn:
+            conn.executemany("""
+            UPDATE processed_files SET size = :size, mtime = :mtime
+            WHERE path = :path AND sha256 = :sha256
+            """, fingerprints)
+        logger.debug("Zaktualizowano mtime %d niezmienionych plików", len(fingerprints))
+    finally:
+        close_connection(conn)
+
+def _nullable(value):
+    """Zamienia NaN na None (NULL w SQLite)."""
+    return None if value != value else float(value)
+
+def save_spectroscopic_constants(constants: Dict, db_name="molcas_results.db"):
+    """Zastępuje zawartość tabeli spectroscopic_constants wynikami dopasowania."""
+    rows = zip(
+        map(int, constants['state_nums']),
+        map(_nullable, constants['r_e']),
+        map(_nullable, constants['e_min']),
+        map(_nullable, constants['d_e']),
+        map(_nullable, constants['omega_e']),
+        map(_nullable, constants['curvature']),
+        map(int, constants['bound'])
+    )
+    conn = open_connection(db_name)
+    try:
+        with conn:
+            conn.execute("DELETE FROM spectroscopic_constants")
+            conn.executemany("""
+            INSERT INTO spectroscopic_constants (
+                state_num, r_e, e_min, d_e, omega_e, curvature, bound
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+    finally:
+        close_connection(conn)
+
+def save_state_tracking(distances, state_nums, curve_ids, db_name="molcas_results.db"):
+    """Zastępuje zawartość tabeli state_tracking macierzą (odległość × stan) krzywych."""
+    rows = ((float(distance), int(state_num), int(curve_ids[i, j]))
+            for i, distance in enumerate(distances)
+            for j, state_num in enumerate(state_nums))
+    conn = open_connection(db_name)
+    try:
+        with conn:
+            conn.execute("DELETE FROM state_tracking")
+            conn.executemany("""
+            INSERT INTO state_tracking (distance, state_num, curve_id)
+            VALUES (?, ?, ?)
+            """, rows)
+    finally:
+        close_connection(conn)
+
+def save_crossings(crossings: Dict, db_name="molcas_results.db"):
+    """Zastępuje zawartość tabeli crossings wynikami detektora przecięć."""
+    rows = zip(
+        map(int, crossings['state_a']),
+        map(int, crossings['state_b']),
+        map(str, crossings['kind']),
+        map(float, crossings['distance']),
+        map(float, crossings['distance_left']),
+        map(float, crossings['distance_right']),
+        map(_nullable, crossings['energy']),
+        map(_nullable, crossings['gap'])
+    )
+    conn = open_connection(db_name)
+    try:
+        with conn:
+            conn.execute("DELETE FROM crossings")
+            conn.executemany("""
+            INSERT INTO crossings (
+                state_a, state_b, kind, distance, distance_left, distance_right, energy, gap
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+    finally:
+        close_connection(conn)
+
+def fetch_crossings(kind=None, db_name="molcas_results.db"):
+    """Przecięcia (state_a, state_b, kind, distance, left, right, energy, gap) posortowane wg odległości."""
+    query = """
+    SELECT state_a, state_b, kind, distance, distance_left, distance_right, energy, gap
+    FROM crossings
+    """
+    params = []
+    if kind is not None:
+        query += " WHERE kind = ?"
+        params.append(kind)
+    query += " ORDER BY distance, state_a, state_b"
+
+    conn = open_connection(db_name, readonly=True)
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        close_connection(conn)
+
+def save_vibrational_levels(levels: Dict, db_name="molcas_results.db"):
+    """Zastępuje zawartość tabeli vibrational_levels poziomami z solvera DVR."""
+    rows = zip(
+        map(int, levels['state_nums']),
+        map(int, levels['v']),
+        map(int, levels['order_index']),
+        map(float, levels['energy']),
+        map(float, levels['term_value']),
+        map(_nullable, levels['r_mean'])
+    )
+    conn = open_connection(db_name)
+    try:
+        with conn:
+            conn.execute("DELETE FROM vibrational_levels")
+            conn.executemany("""
+            INSERT INTO vibrational_levels (
+                state_num, v, order_index, energy, term_value, r_mean
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+    finally:
+        close_connection(conn)
 
 def find_optimal_distance(db_name="molcas_results.db"):
-    conn = sqlite3.connect(db_name)
+    conn = open_connection(db_name, readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
-    SELECT distance, MIN(energy) 
+    SELECT distance, MIN(energy) AS min_energy
     FROM calculations 
     GROUP BY distance
-    ORDER BY energy
+    ORDER BY min_energy
     LIMIT 1
     """)
     
     result = cursor.fetchone()
-    conn.close()
+    close_connection(conn)
     
     if result:
         return result[0]
@@ -93,7 +505,7 @@ def create_state_mapping(db_name="molcas_results.db", optimal_distance=None):
     if optimal_distance is None:
         optimal_distance = find_optimal_distance(db_name)
     
-    conn = sqlite3.connect(db_name)
+    conn = open_connection(db_name, readonly=True)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -118,53 +530,80 @@ def create_state_mapping(db_name="molcas_results.db", optimal_distance=None):
         }
         order_index += 1
     
-    conn.close()
+    close_connection(conn)
     return optimal_distance, state_mapping
 
 
-def update_database_with_mapping(db_name="molcas_results.db"):
-    optimal_distance, state_mapping = create_state_mapping(db_name)
+ORDER_RANKING_SQL = """
+SELECT state_num,
+       ROW_NUMBER() OVER (ORDER BY MIN(energy), state_num) AS order_index
+FROM calculations
+WHERE distance = ?
+GROUP BY state_num
+"""
+
+def update_database_with_mapping(db_name="molcas_results.db", distances=None):
+    """Nadaje order_index i irrep_index kilkoma zapytaniami na całych zbiorach.
+
+    order_index - kolejność energii stanów w optymalnej odległości,
+    irrep_index - kolejność energii w obrębie (distance, irrep, multiplicity, abs_m).
+
+    Przy podanych distances (np. nowo wczytane geometrie) irrep_index jest
+    liczony tylko dla nich, a order_index tylko dla nich, o ile ranking
+    zapisany w optymalnej odległości jest aktualny (inaczej dla całej bazy).
+    """
+    optimal_distance = find_optimal_distance(db_name)
     
-    conn = sqlite3.connect(db_name)
+    conn = open_connection(db_name)
     cursor = conn.cursor()
-    
+
+    order_scope = irrep_scope = ""
+    order_params = irrep_params = []
+    if distances is not None:
+        distances = sorted(set(map(float, distances)))
+        placeholders = ", ".join("?" * len(distances))
+        irrep_scope, irrep_params = f"AND distance IN ({placeholders})", distances
+        # Ranking w optymalnej odległości się nie zmienił - wystarczą nowe wiersze
+        stale = cursor.execute(f"""
+        SELECT COUNT(*)
+        FROM calculations JOIN ({ORDER_RANKING_SQL}) AS ranked USING (state_num)
+        WHERE calculations.distance = ?
+          AND calculations.order_index IS NOT ranked.order_index
+        """, (optimal_distance, optimal_distance)).fetchone()[0]
+        if not stale:
+            order_scope = f"AND calculations.distance IN ({placeholders})"
+            order_params = distances
+
     # Aktualizacja order_index
-    for state_num, data in state_mapping.items():
-        cursor.execute("""
-        UPDATE calculations
-        SET order_index = ?
-        WHERE state_num = ?
-        """, (data['order_index'], state_num))
+    cursor.execute(f"""
+    UPDATE calculations
+    SET order_index = ranked.order_index
+    FROM ({ORDER_RANKING_SQL}) AS ranked
+    WHERE calculations.state_num = ranked.state_num {order_scope}
+    """, (optimal_distance, *order_params))
     
     # Aktualizacja irrep_index
-    cursor.execute("""
-    SELECT DISTINCT distance, irrep, multiplicity, abs_m
-    FROM calculations
-    WHERE irrep IS NOT NULL AND multiplicity IS NOT NULL AND abs_m IS NOT NULL
-    """)
-    
-    symmetry_groups = cursor.fetchall()
-    
-    for distance, irrep, multiplicity, abs_m in symmetry_groups:
-        cursor.execute("""
-        SELECT state_num
+    cursor.execute(f"""
+    UPDATE calculations
+    SET irrep_index = ranked.irrep_index
+    FROM (
+        SELECT distance, state_num,
+               ROW_NUMBER() OVER (
+                   PARTITION BY distance, irrep, multiplicity, abs_m
+                   ORDER BY MIN(energy), state_num
+               ) AS irrep_index
         FROM calculations
-        WHERE distance = ? AND irrep = ? AND multiplicity = ? AND abs_m = ?
-        GROUP BY state_num
-        ORDER BY energy
-        """, (distance, irrep, multiplicity, abs_m))
-        
-        states = cursor.fetchall()
-        
-        for index, (state_num,) in enumerate(states, start=1):
-            cursor.execute("""
-            UPDATE calculations
-            SET irrep_index = ?
-            WHERE state_num = ? AND distance = ?
-            """, (index, state_num, distance))
+        WHERE irrep IS NOT NULL AND multiplicity IS NOT NULL AND abs_m IS NOT NULL {irrep_scope}
+        GROUP BY distance, irrep, multiplicity, abs_m, state_num
+    ) AS ranked
+    WHERE calculations.distance = ranked.distance
+      AND calculations.state_num = ranked.state_num
+    """, irrep_params)
     
     conn.commit()
-    conn.close()
+    close_connection(conn)
+    logger.info("Mapowanie stanów: optymalna odległość %s", optimal_distance,
+                extra={'optimal_distance': optimal_distance})
     
     return optimal_distance
 
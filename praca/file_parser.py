@@ -1,5 +1,44 @@
 import os
+import re
+import hashlib
+import logging
 from collections import defaultdict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nagłówki sekcji rozpoznawane przez parser (po usunięciu białych znaków)
+JOBIPH_HEADER = "Specific data for JOBIPH file"
+NUM_STATES_HEADER = "Nr of states:"
+STATES_MAPPING_HEADER = "State:"
+ENERGY_HEADER = "::"
+ABS_M_HEADER = "SF State"
+HAMILTONIAN_HEADER = "HAMILTONIAN MATRIX FOR THE ORIGINAL STATES"
+OVERLAP_HEADER = "OVERLAP MATRIX FOR THE ORIGINAL STATES"
+TRANSITIONS_HEADER = "++"
+GAUGE_COMPARISON_TITLE = "Length and velocity gauge comparison"
+
+# Tytuły bloków sił przejść i odpowiadające im nazwy (kolumna gauge w bazie)
+TRANSITION_GAUGES = (
+    ("Dipole transition strengths", 'length'),
+    ("Velocity transition strengths", 'velocity'),
+    ("Second-order contribution to the transition strengths", 'second_order'),
+)
+# From, To, Osc. strength, Ax, Ay, Az, Total A
+TRANSITION_COLUMNS = 7
+# From, To, Difference (%), Osc. st. (len.), Osc. st. (vel.)
+GAUGE_COMPARISON_COLUMNS = 5
+# Wiersze porównania cechowań, w których jedna z sił oscylatora jest poniżej progu
+BELOW_THRESHOLD_VELOCITY = re.compile(r"-+\s+(\S+) below threshold")
+BELOW_THRESHOLD_LENGTH = re.compile(r"-+ below threshold")
+
+NUMERIC_START = tuple("-0123456789")
+
+# Stopka zakończonego modułu RASSI i czas obliczeń (szukane w końcówce pliku)
+STOP_MODULE_MARKER = b"--- Stop Module: rassi"
+MODULE_SECONDS_PATTERN = re.compile(rb"--- Module rassi spent (\d+) seconds ---")
+FOOTER_BYTES = 4096
+
 
 def extract_distance_from_filename(filename):
     """Wyciąga odległość z nazwy pliku (format: O2.X.YYYY.rassi.output)."""
@@ -7,86 +46,312 @@ def extract_distance_from_filename(filename):
     return float(f"{parts[1]}.{parts[2]}")
 
 
+def read_footer(file_path, nbytes=FOOTER_BYTES):
+    """Ostatnie nbytes bajtów pliku."""
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(file_path) - nbytes))
+        return f.read()
+
+
+def read_module_seconds(file_path):
+    """Czas obliczeń RASSI ze stopki pliku (sekundy) albo None, gdy stopki brak."""
+    match = MODULE_SECONDS_PATTERN.search(read_footer(file_path))
+    return int(match.group(1)) if match else None
+
+
+def is_finished(file_path):
+    """Czy plik ma stopkę „Stop Module: rassi” (Molcas zakończył obliczenia)."""
+    return STOP_MODULE_MARKER in read_footer(file_path)
+
+
+def file_fingerprint(file_path, chunk_size=1 << 20):
+    """Zwraca odcisk pliku: ścieżkę bezwzględną, rozmiar, mtime i SHA-256 zawartości."""
+    stat = os.stat(file_path)
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': sha256.hexdigest()
+    }
+
+
+def iter_lines(file_path):
+    """Generator zwracający kolejne linie pliku bez białych znaków na końcach."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.strip()
+
+
+def jobiph_name_from_index(jobiph_idx):
+    """Zamienia numer JobIph z mapowania na nazwę pliku.
+
+    1 → JOBIPH (bez numeru), 2 → JOBIPH01, ...
+    """
+    if jobiph_idx == 1:
+        return "JOBIPH"
+    return f"JOBIPH{jobiph_idx-1:02d}"
+
+
+def parse_jobiph_section(header, lines, results):
+    """Parsuje sekcję JOBIPH z wykorzystaniem 'NR OF CONFIG' jako znacznika końca.
+
+    Zwraca linię, która przerwała sekcję (nagłówek kolejnej sekcji JOBIPH),
+    aby główna pętla mogła ją obsłużyć, albo None.
+    """
+    current_data = {
+        "file": header.split("JOBIPH file")[-1].strip(),
+        "irrep": None,
+        "multiplicity": None,
+        "states": []
+    }
+    results['jobiph_data'].append(current_data)
+
+    for line in lines:
+        # Znacznik końca sekcji po nim szukamy kolejnej sekcji
+        if "NR OF CONFIG" in line:
+            return None
+        # Nowa sekcja bez znacznika końca poprzedniej
+        if line.startswith(JOBIPH_HEADER):
+            return line
 
-def parse_jobiph_section(lines, current_line_idx, current_data):
-    """Parsuje sekcję JOBIPH z wykorzystaniem 'NR OF CONFIG' jako znacznika końca."""
-    line = lines[current_line_idx].strip()
-    
-    # Rozpoznawanie nagłówka sekcji
-    if line.startswith("Specific data for JOBIPH file"):
-        if current_data:  # Jeśli już trwa parsowanie innej sekcji
-            return current_data, True  # Zakończ poprzednią sekcję
-            
-        file_name = line.split("JOBIPH file")[-1].strip()
-        return {
-            "file": file_name,
-            "irrep": None,
-            "multiplicity": None,
-            "states": []
-        }, False
-    
-    # Znacznik końca sekcji po nim szukamy koljenej sekcji
-    elif "NR OF CONFIG" in line and current_data:
-        return current_data, True
-    
-    # Parsowanie danych wewnątrz sekcji
-    elif current_data:
         if "STATE IRREP:" in line:
             current_data["irrep"] = int(line.split()[-1])
         elif "SPIN MULTIPLICITY:" in line:
             current_data["multiplicity"] = int(line.split()[-1])
         elif "STATE NR:" in line:
             current_data["states"].append(int(line.split()[-1]))
-        elif "States included from this file:" in line and current_line_idx + 1 < len(lines):
-            next_line = lines[current_line_idx + 1].strip()
+        elif "States included from this file:" in line:
+            next_line = next(lines, "")
             if next_line:
                 current_data["states"] = [int(s) for s in next_line.split() if s.isdigit()]
-    
-    return current_data, False
-
-def parse_states_mapping(lines, current_line_idx, states_mapping):
-    """Parsuje mapowanie stanów z numeracją JOBIPH."""
-    line = lines[current_line_idx]
-    
-    if line.strip().startswith("State:") and current_line_idx + 2 < len(lines):
-        states = list(map(int, line.split()[1:21]))
-        jobiph_indices = list(map(int, lines[current_line_idx + 1].split()[1:21]))
-        roots = list(map(int, lines[current_line_idx + 2].split()[2:22]))
-        
-        for state, jobiph_idx, root in zip(states, jobiph_indices, roots):
-            # Mapowanie indeksów JOBIPH:
-            # 1 → JOBIPH (bez numeru)
-            # 2 → JOBIPH01
-    
-            if jobiph_idx == 1:
-                jobiph_name = "JOBIPH"
-            else:
-                jobiph_name = f"JOBIPH{jobiph_idx-1:02d}"
-            
-            states_mapping[state].append({
-                'jobiph': jobiph_name,
-                'root': root
-            })
-    return states_mapping
-
-def parse_energy_line(line, energies):
-    """Parsuje linie z energiami."""
+    return None
+
+
+def parse_num_states(line, lines, results):
+    """Parsuje liczbę stanów."""
+    results['num_states'] = int(line.split()[-1])
+    return None
+
+
+def parse_states_mapping(line, lines, results):
+    """Parsuje mapowanie stanów z numeracją JOBIPH (linie State/JobIph/Root nr)."""
+    states = line.split()[1:21]
+    jobiph_indices = next(lines, "").split()[1:21]
+    roots = next(lines, "").split()[2:22]
+
+    states_mapping = results['states_mapping']
+    for state, jobiph_idx, root in zip(states, jobiph_indices, roots):
+        states_mapping[int(state)].append({
+            'jobiph': jobiph_name_from_index(int(jobiph_idx)),
+            'root': int(root)
+        })
+    return None
+
+
+def parse_energy_line(line, lines, results):
+    """Parsuje linie z energiami (':: RASSI State N Total energy: E')."""
     if "RASSI State" in line and "Total energy:" in line:
         parts = line.split()
-        state_num = None
-        energy = None
-        
-        for j, part in enumerate(parts):
-            if part.isdigit():
-                state_num = int(part)
-            elif ":" in part and part.replace(".", "").replace("-", "").isdigit():
-                energy = float(part.replace(":", ""))
-            elif part.startswith("-") and part.replace(".", "").replace("-", "").isdigit():
-                energy = float(part)
-        
-        if state_num is not None and energy is not None:
-            energies[state_num] = energy
-    return energies
+        results['energies'][int(parts[3])] = float(parts[-1])
+    return None
+
+
+def parse_abs_m_section(line, lines, results):
+    """Parsuje tabelę SF State / Abs_M aż do pierwszej pustej linii po danych."""
+    if "Abs_M" not in line:
+        return None
+
+    abs_m = results['abs_m']
+    for line in lines:
+        if not line:
+            if abs_m:
+                break
+            continue
+
+        parts = line.split()
+        if len(parts) < 6:
+            break
+        try:
+            abs_m[int(parts[0])] = float(parts[5])
+        except ValueError:
+            break
+    return None
+
+
+def _read_numeric_block(lines):
+    """Zbiera kolejne linie liczbowe (pomijając puste) aż do pierwszej innej linii.
+
+    Zwraca (linie liczbowe, pierwsza linia spoza bloku lub None), a także
+    informację, czy blok był poprzedzony opisem 'Diagonal, with ...'.
+    """
+    numeric_lines = []
+    diagonal = False
+    for line in lines:
+        if not line:
+            continue
+        if line.startswith("Diagonal"):
+            diagonal = True
+            continue
+        if not line.startswith(NUMERIC_START):
+            return numeric_lines, diagonal, line
+        numeric_lines.append(line)
+    return numeric_lines, diagonal, None
+
+
+def numeric_lines_to_matrix(numeric_lines, diagonal, num_states=0):
+    """Zamienia linie bloku macierzy RASSI na tablicę (n, n).
+
+    Postać diagonalna to ciąg n liczb. Postać pełna to bloki kolumn: linia
+    nagłówka z numerami kolumn, a po niej wiersze 'i v_1 ... v_k'; brakujący
+    trójkąt (wydruk tylko dolnej części) uzupełniany jest symetrycznie.
+    Konwersja liczb odbywa się hurtowo przez NumPy, nie przez float() na token.
+    """
+    if diagonal:
+        values = np.array(" ".join(numeric_lines).split(), dtype=np.float64)
+        return np.diag(values)
+
+    n = num_states
+    blocks = []
+    columns = None
+    for line in numeric_lines:
+        if "." not in line:
+            columns = np.array(line.split(), dtype=np.int64) - 1
+            blocks.append((columns, []))
+        elif columns is not None:
+            blocks[-1][1].append(line)
+    if not blocks:
+        return None
+
+    n = max(n, max(int(cols.max()) + 1 for cols, _ in blocks))
+    matrix = np.full((n, n), np.nan)
+    for cols, rows in blocks:
+        if not rows:
+            continue
+        tokens = " ".join(rows).split()
+        if len(tokens) == len(rows) * (len(cols) + 1):
+            data = np.array(tokens, dtype=np.float64).reshape(len(rows), len(cols) + 1)
+            matrix[np.ix_(data[:, 0].astype(np.int64) - 1, cols)] = data[:, 1:]
+        else:
+            for row in rows:
+                data = np.array(row.split(), dtype=np.float64)
+                matrix[int(data[0]) - 1, cols[:len(data) - 1]] = data[1:]
+
+    # Uzupełnienie symetryczne i zera w miejscach niewydrukowanych
+    matrix = np.where(np.isnan(matrix), matrix.T, matrix)
+    return np.nan_to_num(matrix, nan=0.0)
+
+
+def parse_matrix_section(key):
+    """Tworzy parser sekcji macierzy (hamiltonian/overlap) zapisujący wynik pod key."""
+    def parse(line, lines, results):
+        numeric_lines, diagonal, pending = _read_numeric_block(lines)
+        results[key] = numeric_lines_to_matrix(numeric_lines, diagonal, results['num_states'])
+        return pending
+    return parse
+
+
+def _read_table_rows(lines):
+    """Pomija nagłówek tabeli i zbiera kolejne wiersze zaczynające się od cyfry.
+
+    Zwraca (wiersze, linia do ponownego przetworzenia lub None). Blok bez
+    wierszy kończy się na '--' albo na nagłówku kolejnej sekcji '++'.
+    """
+    rows = []
+    for line in lines:
+        if line[:1].isdigit():
+            rows.append(line)
+        elif rows or line == "--":
+            return rows, None
+        elif line.startswith(TRANSITIONS_HEADER):
+            return rows, line
+    return rows, None
+
+
+def rows_to_array(rows, n_columns):
+    """Hurtowa konwersja wierszy tabeli na tablicę (n_wierszy, n_columns).
+
+    Krótsze wiersze (np. blok drugiego rzędu bez współczynników Einsteina)
+    są dopełniane NaN.
+    """
+    tokens = " ".join(rows).split()
+    if len(tokens) == len(rows) * n_columns:
+        return np.array(tokens, dtype=np.float64).reshape(len(rows), n_columns)
+
+    table = np.full((len(rows), n_columns), np.nan)
+    for i, row in enumerate(rows):
+        values = np.array(row.split()[:n_columns], dtype=np.float64)
+        table[i, :len(values)] = values
+    return table
+
+
+def parse_transitions_section(line, lines, results):
+    """Parsuje bloki '++' z siłami przejść i porównaniem cechowań."""
+    for title, gauge in TRANSITION_GAUGES:
+        if title in line:
+            rows, pending = _read_table_rows(lines)
+            results['transitions'][gauge] = rows_to_array(rows, TRANSITION_COLUMNS)
+            return pending
+
+    if GAUGE_COMPARISON_TITLE in line:
+        rows, pending = _read_table_rows(lines)
+        # Wartości poniżej progu (i wtedy nieliczona różnica) zapisywane są jako NaN
+        text = BELOW_THRESHOLD_VELOCITY.sub(r"nan \1 nan", "\n".join(rows))
+        text = BELOW_THRESHOLD_LENGTH.sub("nan nan", text)
+        results['gauge_comparison'] = rows_to_array(text.split("\n") if rows else [],
+                                                    GAUGE_COMPARISON_COLUMNS)
+        return pending
+    return None
+
+
+# Kolejność ma znaczenie: "State:" musi być sprawdzane po dłuższych nagłówkach
+SECTION_HANDLERS = (
+    (JOBIPH_HEADER, parse_jobiph_section),
+    (NUM_STATES_HEADER, parse_num_states),
+    (STATES_MAPPING_HEADER, parse_states_mapping),
+    (ENERGY_HEADER, parse_energy_line),
+    (ABS_M_HEADER, parse_abs_m_section),
+    (HAMILTONIAN_HEADER, parse_matrix_section('hamiltonian')),
+    (OVERLAP_HEADER, parse_matrix_section('overlap')),
+    (TRANSITIONS_HEADER, parse_transitions_section),
+)
+SECTION_PREFIXES = tuple(prefix for prefix, _ in SECTION_HANDLERS)
+
+
+def parse_lines(lines, results):
+    """Maszyna stanów: przechodzi po liniach raz i przekazuje sekcje do parserów.
+
+    Każdy parser sekcji sam pobiera kolejne linie z generatora i może zwrócić
+    linię, której nie obsłużył (np. nagłówek następnej sekcji).
+    """
+    line = next(lines, None)
+    while line is not None:
+        pending = None
+        if line.startswith(SECTION_PREFIXES):
+            for prefix, handler in SECTION_HANDLERS:
+                if line.startswith(prefix):
+                    pending = handler(line, lines, results)
+                    break
+        line = pending if pending is not None else next(lines, None)
+    return results
+
+
+def log_results(results):
+    """Szczegóły wyników parsera na poziomie DEBUG (JOBIPH, mapowanie, energie, Abs_M)."""
+    logger.debug("Liczba stanów: %d", results['num_states'])
+    for jobiph in results['jobiph_data']:
+        logger.debug("JOBIPH %s: irrep=%s, multiplicity=%s, states=%s", jobiph['file'],
+                     jobiph['irrep'], jobiph['multiplicity'], jobiph['states'])
+    for state, mappings in results['states_mapping'].items():
+        for mapping in mappings:
+            logger.debug("State %d: JOBIPH %s, root %d", state, mapping['jobiph'], mapping['root'])
+    for state, energy in results['energies'].items():
+        logger.debug("State %d: E = %s", state, energy)
+    for state, abs_m in results['abs_m'].items():
+        logger.debug("State %d: Abs_M = %s", state, abs_m)
 
 def parse_single_file(file_path):
     """Główna funkcja parsująca pojedynczy plik."""
@@ -96,74 +361,21 @@ def parse_single_file(file_path):
         'energies': {},
         'jobiph_data': [],
         'abs_m': {},
-        'num_states': 0
+        'num_states': 0,
+        'hamiltonian': None,
+        'overlap': None,
+        'transitions': {},
+        'gauge_comparison': None
     }
 
-    abs_m_section = False
-    print(f"\n=== Analizuję plik: {file_path} ===")  # Debug
+    logger.debug("Analizuję plik: %s", file_path)
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    current_data = None
-    for i, line in enumerate(lines):
-        # Liczba stanów
-        if "Nr of states:" in line:
-            results['num_states'] = int(line.split()[-1])
-            print(f"Liczba stanów: {results['num_states']}")  # Debug
-        
-        # Sekcje JOBIPH
-        current_data, should_append = parse_jobiph_section(lines, i, current_data)
-        if should_append:
-            print(f"Znaleziono JOBIPH: {current_data['file']}")  # Debug
-            print(f"  - Irrep: {current_data['irrep']}")  # Debug
-            print(f"  - Multiplicity: {current_data['multiplicity']}")  # Debug
-            print(f"  - States: {current_data['states']}")  # Debug
-            results['jobiph_data'].append(current_data)
-            current_data = None
-        
-        # Mapowanie stanów
-        results['states_mapping'] = parse_states_mapping(lines, i, results['states_mapping'])
-        
-        # Energia
-        results['energies'] = parse_energy_line(line, results['energies'])
-        
-        # SF State i Abs_M
-        if 'SF State' in line and 'Abs_M' in line:
-            abs_m_section = True
-            continue
-        
-        if abs_m_section:
-            parts = line.strip().split()
-            if len(parts) >= 6:
-                try:
-                    state = int(parts[0])
-                    abs_m = float(parts[5])
-                    results['abs_m'][state] = abs_m
-                except (ValueError, IndexError):
-                    pass
-            else:
-                abs_m_section = False
-
-    if current_data:
-        print(f"Znaleziono JOBIPH (na końcu pliku): {current_data['file']}")  # Debug
-        results['jobiph_data'].append(current_data)
-
-    # Dodatkowe debugowanie mapowania stanów
-    print("\nMapowanie stanów:")
-    for state, mappings in results['states_mapping'].items():
-        print(f"State {state}:")
-        for mapping in mappings:
-            print(f"  - JOBIPH: {mapping['jobiph']}, Root: {mapping['root']}")
-
-    # Debugowanie energii
-    print("\nEnergie:")
-    for state, energy in results['energies'].items():
-        print(f"State {state}: {energy}")
+    parse_lines(iter_lines(file_path), results)
 
-    # Debugowanie Abs_M
-    print("\nAbs_M:")
-    for state, abs_m in results['abs_m'].items():
-        print(f"State {state}: {abs_m}")
+    if logger.isEnabledFor(logging.DEBUG):
+        log_results(results)
+    logger.debug("Sparsowano %s: %d stanów, %d energii", os.path.basename(file_path),
+                results['num_states'], len(results['energies']),
+                extra={'file': file_path, 'distance': results['distance']})
 
-    return results
\ No newline at end of file
+    return results
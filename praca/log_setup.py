@@ -0,0 +1,64 @@
+import json
+import logging
+import sys
+import time
+
+# Domyślnie tylko ostrzeżenia i błędy (tryb cichy)
+DEFAULT_LEVEL = logging.WARNING
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Standardowe atrybuty LogRecord; pozostałe (z extra=...) trafiają do JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Ostatnia konfiguracja (przekazywana procesom roboczym)
+_config = (DEFAULT_LEVEL, False)
+
+class JsonFormatter(logging.Formatter):
+    """Jeden obiekt JSON na linię: czas, poziom, logger, komunikat i pola z extra."""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(level=DEFAULT_LEVEL, json_format=False, stream=None):
+    """Konfiguruje główny logger (poziom, format tekstowy lub JSON) na stderr."""
+    global _config
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    _config = (level, json_format)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+def logging_config():
+    """Argumenty setup_logging bieżącej konfiguracji (np. dla puli procesów)."""
+    return _config
+
+def verbosity_level(verbose=0, quiet=False):
+    """Poziom logowania z opcji -v/-q: domyślnie WARNING, -v INFO, -vv DEBUG."""
+    if quiet:
+        return logging.ERROR
+    return {0: logging.WARNING, 1: logging.INFO}.get(verbose, logging.DEBUG)
+
+def add_logging_arguments(parser):
+    """Dodaje do argparse opcje -v/--verbose, -q/--quiet i --log-json."""
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="więcej komunikatów (-v INFO, -vv DEBUG)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="tylko błędy")
+    parser.add_argument("--log-json", action="store_true",
+                        help="logi jako JSON (jeden obiekt na linię)")
@@ -1,65 +1,313 @@
 import os
-from file_parser import parse_single_file
-from database import create_database, save_to_database, update_database_with_mapping
-
-def get_sfstate_absm_data(input_file, max_states=99):
-    """Pobiera dane SF State i Abs_M z pliku."""
-    data = []
-    data_section = False
-    
-    with open(input_file, 'r') as f:
-        for line in f:
-            if len(data) >= max_states:
-                break
-                
-            line = line.strip()
-            
-            if 'SF State' in line and 'Abs_M' in line:
-                data_section = True
-                continue
-                
-            if not data_section or not line:
-                continue
-                
-            parts = line.split()
-            try:
-                sf_state = int(parts[0])
-                if len(parts) >= 6:
-                    abs_m = float(parts[5])
-                    data.append((sf_state, abs_m))
-            except (ValueError, IndexError):
-                continue
-    
-    data.sort(key=lambda x: x[0])
-    return data
-
-def process_all_files(data_dir="dane"):
-    """Przetwarza wszystkie pliki w folderze."""
-    files = [f for f in os.listdir(data_dir) if f.endswith(".rassi.output")]
-    all_results = []
-
-    for filename in sorted(files):
-        file_path = os.path.join(data_dir, filename)
-        try:
-            print(f"Przetwarzam: {filename}")
+import time
+import logging
+import argparse
+from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from file_parser import parse_single_file, file_fingerprint
+from database import (create_database, save_to_database, update_database_with_mapping,
+                      load_manifest, load_manifest_distances, touch_manifest,
+                      database_session)
+from parse_cache import load_cached_results, store_cached_results
+from matrix_store import stage_matrices, merge_matrix_stacks, stored_distances
+from storage import ParquetBackend
+from log_setup import setup_logging, logging_config, verbosity_level, add_logging_arguments
+from profiling import get_profiler, profiling_from_env, PROFILE_ENV
+from spectroscopy import update_spectroscopic_constants
+from state_tracking import update_state_tracking
+from crossings import update_crossings
+from vibrational import update_vibrational_levels
+
+logger = logging.getLogger("main")
+
+def parse_file_safe(file_path, known_sha256=None, cache_dir=None):
+    """Parsuje plik i zamiast rzucać wyjątek zwraca (wyniki, odcisk, błąd).
+
+    Jeśli SHA-256 pliku jest równy known_sha256, plik nie jest parsowany
+    i zwracane wyniki to None. Przy podanym cache_dir wyniki są najpierw
+    szukane w cache parsera, a nowo sparsowane są do niego zapisywane.
+    """
+    try:
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint['sha256'] == known_sha256:
+            return None, fingerprint, None
+        start = time.perf_counter()
+        results = None
+        if cache_dir is not None:
+            results = load_cached_results(fingerprint['sha256'], cache_dir)
+        if results is None:
             results = parse_single_file(file_path)
-            abs_m_data = get_sfstate_absm_data(file_path)
-            results['abs_m'] = {state: abs_m for state, abs_m in abs_m_data}
-            all_results.append(results)
-        except Exception as e:
-            print(f"Błąd w {filename}: {str(e)}")
-    
-    return all_results
+            if cache_dir is not None:
+                store_cached_results(results, fingerprint['sha256'], cache_dir)
+        results['source'] = fingerprint
+        results['parse_seconds'] = time.perf_counter() - start
+        return results, fingerprint, None
+    except Exception as e:
+        return None, None, str(e)
+
+def select_changed_files(paths, manifest):
+    """Zwraca pliki nowe lub zmienione względem manifestu wraz z ich znanym SHA-256.
+
+    Plik o tym samym rozmiarze i mtime co w manifeście jest pomijany bez czytania.
+    """
+    changed = []
+    for path in paths:
+        entry = manifest.get(os.path.abspath(path))
+        if entry is None:
+            changed.append((path, None))
+            continue
+        size, mtime, sha256 = entry
+        stat = os.stat(path)
+        if stat.st_size != size or stat.st_mtime != mtime:
+            changed.append((path, sha256))
+    return changed
+
+# Liczba plików zapisywanych do bazy w jednej transakcji
+BATCH_SIZE = 32
+# Maksymalna liczba zleconych, a jeszcze nieodebranych zadań na proces
+IN_FLIGHT_PER_WORKER = 2
+
+def iter_parsed(paths, known_hashes, parse, workers=1, max_in_flight=None):
+    """Parsuje pliki i zwraca (ścieżka, wynik parse) w kolejności ścieżek.
+
+    W puli procesów zleconych jest naraz najwyżej max_in_flight zadań
+    (domyślnie IN_FLIGHT_PER_WORKER na proces), więc w pamięci czeka
+    ograniczona liczba wyników, niezależnie od liczby plików.
+    """
+    if workers <= 1:
+        yield from zip(paths, map(parse, paths, known_hashes))
+        return
+
+    max_in_flight = max_in_flight or workers * IN_FLIGHT_PER_WORKER
+    tasks = iter(zip(paths, known_hashes))
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=setup_logging,
+                             initargs=logging_config()) as executor:
+        for path, sha256 in islice(tasks, max_in_flight):
+            pending.append((path, executor.submit(parse, path, sha256)))
+        while pending:
+            path, future = pending.popleft()
+            for next_path, sha256 in islice(tasks, 1):
+                pending.append((next_path, executor.submit(parse, next_path, sha256)))
+            yield path, future.result()
+
+def iter_parsed_files(data_dir="dane", workers=1, db_name=None, cache_dir=None,
+                      max_in_flight=None):
+    """Generator wyników parsera dla plików w folderze (bez plików z błędami).
+
+    Przy workers > 1 pliki są parsowane równolegle w puli procesów
+    (0 lub None = liczba rdzeni), wyniki zachowują kolejność posortowanych
+    nazw plików. Jeśli podano db_name, parsowane są tylko pliki nowe lub
+    zmienione względem manifestu w bazie. cache_dir włącza binarny cache
+    wyników parsera (parse_cache).
+    """
+    files = sorted(f for f in os.listdir(data_dir) if f.endswith(".rassi.output"))
+    paths = [os.path.join(data_dir, f) for f in files]
+    unchanged = []
+
+    if db_name is not None:
+        to_parse = select_changed_files(paths, load_manifest(db_name))
+    else:
+        to_parse = [(path, None) for path in paths]
+    skipped = len(paths) - len(to_parse)
+    to_parse_paths = [path for path, _ in to_parse]
+    known_hashes = [sha256 for _, sha256 in to_parse]
+
+    parse = partial(parse_file_safe, cache_dir=cache_dir)
+    workers = workers or os.cpu_count() or 1
+    for path, (results, fingerprint, error) in iter_parsed(to_parse_paths, known_hashes,
+                                                           parse, workers, max_in_flight):
+        filename = os.path.basename(path)
+        if error is not None:
+            logger.error("Błąd w %s: %s", filename, error, extra={'file': path})
+            continue
+        logger.info("Przetwarzam: %s", filename, extra={'file': path})
+        if results is None:
+            unchanged.append(fingerprint)
+            continue
+        get_profiler().record_file(path, results.pop('parse_seconds'), fingerprint['size'])
+        yield results
+
+    if db_name is not None:
+        if unchanged:
+            touch_manifest(unchanged, db_name)
+        logger.info("Pominięto %d niezmienionych plików", skipped + len(unchanged))
+
+def process_all_files(data_dir="dane", workers=1, db_name=None, cache_dir=None):
+    """Przetwarza wszystkie pliki w folderze i zwraca listę wyników."""
+    return list(iter_parsed_files(data_dir, workers, db_name, cache_dir))
+
+def iter_batches(items, batch_size=BATCH_SIZE):
+    """Dzieli strumień na listy po batch_size elementów."""
+    items = iter(items)
+    while batch := list(islice(items, batch_size)):
+        yield batch
+
+def backfill_stores(db_name, skip_distances, workers=1, cache_dir=None,
+                    batch_size=BATCH_SIZE, matrix_dir=None, parquet=None):
+    """Uzupełnia magazyny pochodne o pliki wczytane do bazy bez nich.
+
+    Pliki zgodne z manifestem nie są ponownie parsowane, więc dodanie
+    --matrix-dir lub --parquet-dir do istniejącej bazy zostawiłoby magazyn pusty. Pliki
+    z manifestu, których odległości brakuje w magazynie (i nie ma ich
+    w skip_distances), są parsowane ponownie – z cache parsera, jeśli podano
+    cache_dir – i zapisywane tylko tam, gdzie ich brakuje. Zwraca liczbę
+    uzupełnionych plików.
+    """
+    # Magazyn → (brakujące odległości, zapis partii)
+    stores = {}
+    if matrix_dir is not None:
+        stores['matrix_staging'] = (stored_distances(matrix_dir),
+                                    partial(stage_matrices, store_dir=matrix_dir))
+    if parquet is not None:
+        stores['parquet_save'] = (parquet.stored_distances(), parquet.save_results)
+    manifest = load_manifest_distances(db_name)
+    missing = {name: {distance for distance in manifest.values()
+                      if distance not in stored and distance not in skip_distances}
+               for name, (stored, _) in stores.items()}
+    paths = sorted(path for path, distance in manifest.items()
+                   if any(distance in distances for distances in missing.values()))
+    if not paths:
+        return 0
+    logger.info("Uzupełniam magazyny o %d wcześniej wczytanych plików", len(paths),
+                extra={name: len(distances) for name, distances in missing.items()})
+
+    profiler = get_profiler()
+    parse = partial(parse_file_safe, cache_dir=cache_dir)
+
+    def parsed_results():
+        for path, (results, _, error) in iter_parsed(paths, [None] * len(paths), parse,
+                                                     workers or os.cpu_count() or 1):
+            if error is not None:
+                logger.error("Błąd w %s: %s", os.path.basename(path), error, extra={'file': path})
+                continue
+            yield results
+
+    count = 0
+    for batch in iter_batches(parsed_results(), batch_size):
+        for name, (_, save) in stores.items():
+            selected = [result for result in batch if result['distance'] in missing[name]]
+            if selected:
+                with profiler.stage(name):
+                    save(selected)
+        count += len(batch)
+    return count
+
+def ingest_files(data_dir, db_name, workers=1, cache_dir=None, force=False,
+                 batch_size=BATCH_SIZE, matrix_dir=None, parquet=None):
+    """Strumieniowo wczytuje pliki do bazy: parsowanie → wiersze → zapis partiami.
+
+    Każda partia zapisywana jest w osobnej transakcji razem z wpisami
+    manifestu, więc przerwanie w połowie zostawia wcześniejsze partie
+    w bazie, a kolejne uruchomienie wczyta tylko brakujące pliki. W pamięci
+    trzymana jest najwyżej jedna partia wyników; macierze partii trafiają
+    do staging/ w matrix_dir, a stosy budowane są raz na końcu (brakujące
+    w nich, wcześniej wczytane pliki uzupełnia backfill_stores). Zwraca listę
+    odległości zapisanych plików.
+    """
+    profiler = get_profiler()
+    distances = []
+    results = iter_parsed_files(data_dir, workers, None if force else db_name, cache_dir)
+    for batch in iter_batches(results, batch_size):
+        with profiler.stage("save"):
+            rows = save_to_database(batch, db_name)
+        nbytes = sum(result['source']['size'] for result in batch)
+        profiler.count("save", rows, nbytes)
+        profiler.count("ingest", rows, nbytes)
+        if matrix_dir is not None:
+            with profiler.stage("matrix_staging"):
+                stage_matrices(batch, matrix_dir)
+        if parquet is not None:
+            with profiler.stage("parquet_save"):
+                parquet.save_results(batch)
+        distances.extend(result['distance'] for result in batch)
+    if not force and (matrix_dir is not None or parquet is not None):
+        backfill_stores(db_name, set(distances), workers, cache_dir, batch_size,
+                        matrix_dir, parquet)
+    if matrix_dir is not None:
+        # Stosy budowane raz po wczytaniu: koszt liniowy w liczbie geometrii
+        with profiler.stage("matrix_stacks"):
+            merge_matrix_stacks(matrix_dir)
+    return distances
+
+def run_pipeline(args):
+    """Wczytanie plików, zapis do bazy i obliczenia pochodne."""
+    profiler = get_profiler()
+    create_database(args.db)
+    parquet = None
+    if args.parquet_dir is not None:
+        parquet = ParquetBackend(args.parquet_dir)
+    with profiler.stage("ingest"):
+        ingest_files(args.data_dir, args.db, workers=args.workers, cache_dir=args.cache_dir,
+                     force=args.force, batch_size=args.batch_size,
+                     matrix_dir=args.matrix_dir, parquet=parquet)
 
-if __name__ == "__main__":
-    create_database()
-    results = process_all_files()
-    save_to_database(results)
-    
     # Dodajemy nową część:
-    print("\nPrzetwarzanie mapowania stanów...")
-    optimal_distance = update_database_with_mapping()
-    
-    print(f"\nOptymalna odległość: {optimal_distance} Å")
-    print("Mapowanie stanów zakończone pomyślnie")
-    print("Dane zapisane do bazy 'molcas_results.db'")
\ No newline at end of file
+    logger.info("Przetwarzanie mapowania stanów...")
+    with profiler.stage("mapping"):
+        optimal_distance = update_database_with_mapping(args.db)
+
+    logger.info("Optymalna odległość: %s Å", optimal_distance)
+    if parquet is not None:
+        with profiler.stage("parquet_mapping"):
+            parquet.update_mapping()
+        logger.info("Magazyn Parquet zaktualizowany: '%s'", args.parquet_dir)
+
+    with profiler.stage("spectroscopy"):
+        constants = update_spectroscopic_constants(args.db)
+    logger.info("Stałe spektroskopowe: %d stanów wiążących", int(constants['bound'].sum()))
+
+    with profiler.stage("state_tracking"):
+        update_state_tracking(args.db)
+    logger.info("Śledzenie stanów zapisane w tabeli state_tracking")
+
+    with profiler.stage("crossings"):
+        crossings = update_crossings(args.db)
+    logger.info("Przecięcia krzywych: %d (tabela crossings)", len(crossings['distance']))
+
+    with profiler.stage("vibrational"):
+        vibrational = update_vibrational_levels(args.db)
+    logger.info("Poziomy oscylacyjne %d stanów w tabeli vibrational_levels",
+                len(vibrational['state_nums']))
+    logger.info("Dane zapisane do bazy '%s'", args.db)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Wczytuje wyniki RASSI do bazy danych.")
+    parser.add_argument("--data-dir", default="dane", help="folder z plikami .rassi.output")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="liczba procesów parsujących (0 = liczba rdzeni)")
+    parser.add_argument("--db", default="molcas_results.db", help="plik bazy SQLite")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="liczba plików zapisywanych w jednej transakcji")
+    parser.add_argument("--force", action="store_true",
+                        help="parsuje wszystkie pliki, ignorując manifest")
+    parser.add_argument("--cache-dir", default=None,
+                        help="folder binarnego cache wyników parsera")
+    parser.add_argument("--matrix-dir", default=None,
+                        help="folder na stosy macierzy hamiltonianu i nakładania (.npy)")
+    parser.add_argument("--journal-mode", default="WAL",
+                        help="tryb dziennika SQLite (WAL pozwala czytać bazę w trakcie zapisu)")
+    parser.add_argument("--synchronous", default="NORMAL", help="pragma synchronous SQLite")
+    parser.add_argument("--parquet-dir", default=None,
+                        help="dodatkowy kolumnowy magazyn Parquet (wymaga pyarrow; "
+                             "trafiają do niego tylko przetwarzane pliki, pierwszy raz użyj --force)")
+    parser.add_argument("--profile", default=None, metavar="RAPORT.json",
+                        help=f"zapisuje raport czasów etapów (również przez ${PROFILE_ENV})")
+    parser.add_argument("--profile-dir", default=None,
+                        help="folder na zrzuty cProfile etapów (.pstats)")
+    add_logging_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(verbosity_level(args.verbose, args.quiet), args.log_json)
+    report_path = profiling_from_env(args.profile, args.profile_dir)
+    # Jedno połączenie (pragmy, cache zapytań) dla całego potoku
+    with database_session(args.db, journal_mode=args.journal_mode,
+                          synchronous=args.synchronous):
+        run_pipeline(args)
+    if report_path is not None:
+        get_profiler().write_report(report_path)
+        logger.info("Raport profilowania zapisany do '%s'", report_path)
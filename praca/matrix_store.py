@@ -0,0 +1,147 @@
+import os
+from typing import List, Dict
+import numpy as np
+
+# Rodzaje macierzy parsowanych z wyjść RASSI (klucze w wynikach parse_single_file)
+MATRIX_KINDS = ('hamiltonian', 'overlap')
+
+def matrix_stack_path(store_dir, kind):
+    """Ścieżka stosu macierzy: jeden plik .npy z odległością i macierzą w każdym wierszu."""
+    return os.path.join(store_dir, f"{kind}.npy")
+
+def stack_dtype(size):
+    """Typ wiersza stosu – odległość trzymana jest w tym samym pliku co macierz,
+    więc podmiana pliku jednym os.replace nie może rozspójnić indeksu odległości."""
+    return np.dtype([('distance', np.float64), ('matrix', np.float64, (size, size))])
+
+def open_matrix_stack(store_dir, kind):
+    """Otwiera stos macierzy jako memmap tylko do odczytu.
+
+    Zwraca (odległości, macierze), gdzie macierze[i] odpowiada odległości
+    odległości[i]; dane są czytane z dysku dopiero przy dostępie do wycinka.
+    """
+    path = matrix_stack_path(store_dir, kind)
+    stack = np.load(path, mmap_mode='r')
+    if stack.dtype.names != ('distance', 'matrix'):
+        raise ValueError(f"Nieobsługiwany format stosu {path} - usuń folder i wczytaj "
+                         f"pliki ponownie (--force)")
+    return np.array(stack['distance']), stack['matrix']
+
+def stored_distances(store_dir):
+    """Odległości obecne we wszystkich stosach (razem z czekającymi w staging/)."""
+    stored = None
+    for kind in MATRIX_KINDS:
+        distances = set()
+        if os.path.exists(matrix_stack_path(store_dir, kind)):
+            distances.update(open_matrix_stack(store_dir, kind)[0].tolist())
+        for path in _staged_files(store_dir, kind):
+            distances.update(np.load(path, mmap_mode='r')['distance'].tolist())
+        stored = distances if stored is None else stored & distances
+    return stored
+
+def matrix_at(store_dir, kind, distance):
+    """Zwraca macierz dla jednej odległości (KeyError, gdy jej brak)."""
+    distances, matrices = open_matrix_stack(store_dir, kind)
+    i = np.searchsorted(distances, distance)
+    if i >= len(distances) or distances[i] != distance:
+        raise KeyError(f"Brak macierzy {kind} dla odległości {distance}")
+    return np.array(matrices[i])
+
+def staging_dir(store_dir):
+    return os.path.join(store_dir, "staging")
+
+def stage_matrices(all_results: List[Dict], store_dir):
+    """Zapisuje macierze jednej partii wyników do osobnych plików w staging/.
+
+    Koszt zależy tylko od rozmiaru partii; stosy są budowane raz przez
+    merge_matrix_stacks. Pliki pozostawione przez przerwane wczytywanie są
+    scalane przy następnym wywołaniu merge_matrix_stacks.
+    """
+    directory = staging_dir(store_dir)
+    os.makedirs(directory, exist_ok=True)
+    # Numer w nazwie zachowuje kolejność partii (późniejsza wygrywa przy scalaniu)
+    sequence = 1 + max((int(name.split(".")[1]) for name in os.listdir(directory)
+                        if name.endswith(".npy")), default=-1)
+    for kind in MATRIX_KINDS:
+        matrices = [(result['distance'], result[kind]) for result in all_results
+                    if result.get(kind) is not None]
+        if not matrices:
+            continue
+        size = max(matrix.shape[0] for _, matrix in matrices)
+        rows = np.zeros(len(matrices), dtype=stack_dtype(size))
+        for row, (distance, matrix) in zip(rows, matrices):
+            row['distance'] = distance
+            row['matrix'][:matrix.shape[0], :matrix.shape[1]] = matrix
+        path = os.path.join(directory, f"{kind}.{sequence:06d}.npy")
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, rows)
+        os.replace(path + ".tmp", path)
+
+def _staged_files(store_dir, kind):
+    directory = staging_dir(store_dir)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith(kind + ".") and name.endswith(".npy"))
+
+def merge_matrix_stacks(store_dir):
+    """Scala macierze ze staging/ ze stosami na dysku w jednym przebiegu.
+
+    Istniejące odległości są zastępowane nowymi danymi (z późniejszych
+    partii), pozostałe kopiowane wiersz po wierszu ze starego pliku, więc
+    w pamięci nie trzeba trzymać całego stosu. Nowy plik zapisywany jest
+    obok i podmieniany przez os.replace; pliki ze staging/ są usuwane
+    dopiero potem.
+    """
+    for kind in MATRIX_KINDS:
+        staged_paths = _staged_files(store_dir, kind)
+        if not staged_paths:
+            continue
+        staged = [np.load(path, mmap_mode='r') for path in staged_paths]
+        # Źródło każdej odległości: (stos, indeks); nowsze partie nadpisują starsze
+        source = {}
+        for part, rows in enumerate(staged):
+            for i, distance in enumerate(rows['distance'].tolist()):
+                source[distance] = (part, i)
+
+        stack_path = matrix_stack_path(store_dir, kind)
+        old_distances = np.empty(0)
+        old_matrices = None
+        if os.path.exists(stack_path):
+            old_distances, old_matrices = open_matrix_stack(store_dir, kind)
+
+        sizes = {rows['matrix'].shape[1] for rows in staged}
+        size = max(sizes)
+        if old_matrices is not None and old_matrices.shape[1] != size:
+            raise ValueError(f"Niezgodny rozmiar macierzy {kind}: "
+                             f"{old_matrices.shape[1]} na dysku, {size} w nowych danych")
+
+        distances = np.union1d(old_distances, np.fromiter(source.keys(), dtype=np.float64))
+        tmp_path = stack_path + ".tmp"
+        stack = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=stack_dtype(size),
+                                          shape=(len(distances),))
+        stack['distance'] = distances
+        matrices = stack['matrix']
+        old_index = {distance: i for i, distance in enumerate(old_distances.tolist())}
+        for i, distance in enumerate(distances.tolist()):
+            if distance in source:
+                part, row = source[distance]
+                matrix = staged[part]['matrix'][row]
+                matrices[i] = 0.0
+                matrices[i, :matrix.shape[0], :matrix.shape[1]] = matrix
+            else:
+                matrices[i] = old_matrices[old_index[distance]]
+        stack.flush()
+        del stack, matrices, old_matrices, staged
+        os.replace(tmp_path, stack_path)
+        for path in staged_paths:
+            os.remove(path)
+
+def update_matrix_stacks(all_results: List[Dict], store_dir):
+    """Dopisuje macierze z wyników parsera do stosów na dysku (staging + scalenie).
+
+    Każde wywołanie przepisuje cały stos, więc przy wczytywaniu partiami
+    należy używać stage_matrices dla partii i jednego merge_matrix_stacks na końcu.
+    """
+    stage_matrices(all_results, store_dir)
+    merge_matrix_stacks(store_dir)
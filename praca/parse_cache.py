@@ -0,0 +1,115 @@
+import os
+import tempfile
+from collections import defaultdict
+import numpy as np
+
+# Zmiana formatu wyników parsera musi podbić wersję, stare wpisy są wtedy ignorowane
+CACHE_VERSION = 3
+
+def cache_path(cache_dir, sha256):
+    """Ścieżka pliku cache dla danego skrótu SHA-256 zawartości."""
+    return os.path.join(cache_dir, f"{sha256}.npz")
+
+def _optional_int(value):
+    return -1 if value is None else value
+
+def _optional_matrix(matrix):
+    return np.empty((0, 0)) if matrix is None else np.asarray(matrix, dtype=np.float64)
+
+def results_to_arrays(results):
+    """Zamienia słownik wyników parsera na płaskie tablice NumPy.
+
+    Tablice sił przejść zapisywane są pod kluczami 'transitions_<gauge>'.
+    """
+    mapping_states, mapping_jobiph, mapping_roots = [], [], []
+    for state, mappings in results['states_mapping'].items():
+        for mapping in mappings:
+            mapping_states.append(state)
+            mapping_jobiph.append(mapping['jobiph'])
+            mapping_roots.append(mapping['root'])
+
+    jobiph_data = results['jobiph_data']
+    jobiph_states = [state for job in jobiph_data for state in job['states']]
+    jobiph_offsets = np.cumsum([0] + [len(job['states']) for job in jobiph_data])
+
+    return {
+        'version': np.int32(CACHE_VERSION),
+        'distance': np.float64(results['distance']),
+        'num_states': np.int32(results['num_states']),
+        'energy_states': np.fromiter(results['energies'].keys(), dtype=np.int32),
+        'energies': np.fromiter(results['energies'].values(), dtype=np.float64),
+        'abs_m_states': np.fromiter(results['abs_m'].keys(), dtype=np.int32),
+        'abs_m': np.fromiter(results['abs_m'].values(), dtype=np.float64),
+        'mapping_states': np.array(mapping_states, dtype=np.int32),
+        'mapping_jobiph': np.array(mapping_jobiph, dtype=str),
+        'mapping_roots': np.array(mapping_roots, dtype=np.int32),
+        'jobiph_files': np.array([job['file'] for job in jobiph_data], dtype=str),
+        'jobiph_irrep': np.array([_optional_int(job['irrep']) for job in jobiph_data], dtype=np.int32),
+        'jobiph_multiplicity': np.array([_optional_int(job['multiplicity']) for job in jobiph_data],
+                                        dtype=np.int32),
+        'jobiph_states': np.array(jobiph_states, dtype=np.int32),
+        'jobiph_offsets': jobiph_offsets.astype(np.int32),
+        'hamiltonian': _optional_matrix(results.get('hamiltonian')),
+        'overlap': _optional_matrix(results.get('overlap')),
+        'gauge_comparison': _optional_matrix(results.get('gauge_comparison')),
+        **{f"transitions_{gauge}": table
+           for gauge, table in results.get('transitions', {}).items()},
+    }
+
+def arrays_to_results(arrays):
+    """Odtwarza słownik wyników parsera z tablic zapisanych w cache."""
+    states_mapping = defaultdict(list)
+    for state, jobiph, root in zip(arrays['mapping_states'].tolist(),
+                                   arrays['mapping_jobiph'].tolist(),
+                                   arrays['mapping_roots'].tolist()):
+        states_mapping[state].append({'jobiph': jobiph, 'root': root})
+
+    jobiph_states = arrays['jobiph_states'].tolist()
+    offsets = arrays['jobiph_offsets'].tolist()
+    jobiph_data = []
+    for i, (file_name, irrep, multiplicity) in enumerate(zip(arrays['jobiph_files'].tolist(),
+                                                            arrays['jobiph_irrep'].tolist(),
+                                                            arrays['jobiph_multiplicity'].tolist())):
+        jobiph_data.append({
+            'file': file_name,
+            'irrep': None if irrep < 0 else irrep,
+            'multiplicity': None if multiplicity < 0 else multiplicity,
+            'states': jobiph_states[offsets[i]:offsets[i + 1]]
+        })
+
+    return {
+        'distance': float(arrays['distance']),
+        'states_mapping': states_mapping,
+        'energies': dict(zip(arrays['energy_states'].tolist(), arrays['energies'].tolist())),
+        'jobiph_data': jobiph_data,
+        'abs_m': dict(zip(arrays['abs_m_states'].tolist(), arrays['abs_m'].tolist())),
+        'num_states': int(arrays['num_states']),
+        'hamiltonian': arrays['hamiltonian'] if arrays['hamiltonian'].size else None,
+        'overlap': arrays['overlap'] if arrays['overlap'].size else None,
+        'transitions': {key[len("transitions_"):]: arrays[key] for key in arrays.files
+                        if key.startswith("transitions_")},
+        'gauge_comparison': arrays['gauge_comparison'] if arrays['gauge_comparison'].size else None
+    }
+
+def load_cached_results(sha256, cache_dir):
+    """Wczytuje wyniki z cache; zwraca None, gdy brak wpisu lub jest nieaktualny."""
+    path = cache_path(cache_dir, sha256)
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            if int(arrays['version']) != CACHE_VERSION:
+                return None
+            return arrays_to_results(arrays)
+    except (OSError, KeyError, ValueError):
+        return None
+
+def store_cached_results(results, sha256, cache_dir):
+    """Zapisuje wyniki do cache (atomowo: plik tymczasowy + os.replace)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **results_to_arrays(results))
+        os.replace(tmp_path, cache_path(cache_dir, sha256))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
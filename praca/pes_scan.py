@@ -0,0 +1,165 @@
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+import numpy as np
+from database import open_connection, close_connection
+
+# Kolumny tabeli calculations potrzebne do zbudowania skanu
+SCAN_COLUMNS = ('distance', 'state_num', 'energy', 'abs_m', 'irrep', 'multiplicity',
+                'order_index')
+
+@dataclass
+class PESScan:
+    """Cały skan PES jako gęste tablice NumPy.
+
+    Wiersze odpowiadają odległościom (posortowanym rosnąco), kolumny numerom
+    stanów RASSI (state_nums). Brakujące energie i Abs_M to NaN, brakujące
+    irrep/multiplicity to 0, brakujący order_index to 0.
+    """
+    distances: np.ndarray       # (n_distances,)
+    state_nums: np.ndarray      # (n_states,)
+    energies: np.ndarray        # (n_distances, n_states)
+    abs_m: np.ndarray           # (n_distances, n_states)
+    multiplicity: np.ndarray    # (n_distances, n_states)
+    irrep: np.ndarray           # (n_distances, n_states)
+    order_index: Optional[np.ndarray] = None  # (n_states,)
+
+    @property
+    def n_distances(self):
+        return len(self.distances)
+
+    @property
+    def n_states(self):
+        return len(self.state_nums)
+
+    @classmethod
+    def empty(cls, distances, state_nums):
+        """Tworzy skan o podanych osiach wypełniony wartościami „brak danych”."""
+        distances = np.asarray(distances, dtype=np.float64)
+        state_nums = np.asarray(state_nums, dtype=np.int64)
+        shape = (len(distances), len(state_nums))
+        return cls(
+            distances=distances,
+            state_nums=state_nums,
+            energies=np.full(shape, np.nan),
+            abs_m=np.full(shape, np.nan),
+            multiplicity=np.zeros(shape, dtype=np.int64),
+            irrep=np.zeros(shape, dtype=np.int64),
+            order_index=np.zeros(len(state_nums), dtype=np.int64)
+        )
+
+    @classmethod
+    def from_results(cls, all_results: List[Dict]):
+        """Buduje skan bezpośrednio z wyników parse_single_file."""
+        distances = np.unique([result['distance'] for result in all_results])
+        state_nums = np.unique([state for result in all_results
+                                for state in result['energies']]).astype(np.int64)
+        scan = cls.empty(distances, state_nums)
+
+        for result in all_results:
+            row = np.searchsorted(distances, result['distance'])
+
+            states = np.fromiter(result['energies'].keys(), dtype=np.int64)
+            scan.energies[row, np.searchsorted(state_nums, states)] = \
+                np.fromiter(result['energies'].values(), dtype=np.float64)
+
+            states = np.fromiter(result['abs_m'].keys(), dtype=np.int64)
+            states_known = np.isin(states, state_nums)
+            scan.abs_m[row, np.searchsorted(state_nums, states[states_known])] = \
+                np.fromiter(result['abs_m'].values(), dtype=np.float64)[states_known]
+
+            jobiph_map = {job['file']: job for job in result['jobiph_data']}
+            for state, mappings in result['states_mapping'].items():
+                if state not in result['energies']:
+                    continue
+                col = np.searchsorted(state_nums, state)
+                for mapping in mappings:
+                    job = jobiph_map.get(mapping['jobiph'])
+                    if job is not None:
+                        scan.irrep[row, col] = job['irrep'] or 0
+                        scan.multiplicity[row, col] = job['multiplicity'] or 0
+        return scan
+
+    @classmethod
+    def from_database(cls, db_name="molcas_results.db", states=None):
+        """Buduje skan jednym zapytaniem do tabeli calculations."""
+        query = """
+        SELECT distance, state_num, energy, abs_m, irrep, multiplicity, order_index
+        FROM calculations
+        """
+        params = ()
+        if states is not None:
+            states = list(states)
+            query += f"WHERE state_num IN ({','.join('?' * len(states))})"
+            params = states
+
+        conn = open_connection(db_name, readonly=True)
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            close_connection(conn)
+
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(SCAN_COLUMNS))
+        return cls.from_columns(dict(zip(SCAN_COLUMNS, data.T)))
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]):
+        """Buduje skan z kolumn SCAN_COLUMNS (np. z StorageBackend.fetch)."""
+        distances, rows_idx = np.unique(columns['distance'], return_inverse=True)
+        state_nums, cols_idx = np.unique(columns['state_num'].astype(np.int64),
+                                         return_inverse=True)
+        scan = cls.empty(distances, state_nums)
+
+        scan.energies[rows_idx, cols_idx] = columns['energy']
+        scan.abs_m[rows_idx, cols_idx] = columns['abs_m']
+        scan.irrep[rows_idx, cols_idx] = np.nan_to_num(columns['irrep']).astype(np.int64)
+        scan.multiplicity[rows_idx, cols_idx] = \
+            np.nan_to_num(columns['multiplicity']).astype(np.int64)
+        scan.order_index[cols_idx] = np.nan_to_num(columns['order_index']).astype(np.int64)
+        return scan
+
+    @classmethod
+    def from_storage(cls, backend, states=None, **filters):
+        """Buduje skan z dowolnego magazynu (storage.StorageBackend).
+
+        Dodatkowe filtry (distances, abs_m, multiplicity, irrep) przekazywane
+        są do backendu, więc magazyn kolumnowy czyta tylko potrzebne dane.
+        """
+        return cls.from_columns(backend.fetch(SCAN_COLUMNS, states=states, **filters))
+
+    def state_index(self, state_num):
+        """Indeks kolumny dla numeru stanu RASSI."""
+        col = np.searchsorted(self.state_nums, state_num)
+        if np.any(col >= self.n_states) or np.any(self.state_nums[col] != state_num):
+            raise KeyError(f"Brak stanu {state_num} w skanie")
+        return col
+
+    def curve(self, state_num):
+        """Energie jednego stanu we wszystkich odległościach."""
+        return self.energies[:, self.state_index(state_num)]
+
+    def symmetry_mask(self, abs_m=None, multiplicity=None, irrep=None):
+        """Maska (n_distances, n_states) punktów o zadanej symetrii."""
+        mask = ~np.isnan(self.energies)
+        if abs_m is not None:
+            mask &= self.abs_m == abs_m
+        if multiplicity is not None:
+            mask &= self.multiplicity == multiplicity
+        if irrep is not None:
+            mask &= self.irrep == irrep
+        return mask
+
+    def masked_energies(self, mask):
+        """Energie z NaN poza maską."""
+        return np.where(mask, self.energies, np.nan)
+
+    def minima(self):
+        """Minimum energii każdego stanu i odległość, w której występuje.
+
+        Stany bez żadnej energii mają NaN w obu tablicach.
+        """
+        has_data = ~np.all(np.isnan(self.energies), axis=0)
+        filled = np.where(np.isnan(self.energies), np.inf, self.energies)
+        rows = np.argmin(filled, axis=0)
+        min_energies = np.where(has_data, filled[rows, np.arange(self.n_states)], np.nan)
+        min_distances = np.where(has_data, self.distances[rows], np.nan)
+        return min_energies, min_distances
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+from pes_scan import PESScan
+
+# Nagłówek szerokiej tabeli PES (format dane/pes/rassi.out)
+PES_TABLE_HEADER = "# Data from O2.R.rassi.output\n# R/2 (Bohr) E (a.u.) rassi"
+
+# Szerokości kolumn: odległość, pierwsza energia, kolejne energie
+DISTANCE_WIDTH = 10
+FIRST_ENERGY_FORMAT = "%22.8f"
+ENERGY_FORMAT = "%20.8f"
+
+# Rozszerzenie pliku binarnego (ten sam układ co tabela tekstowa)
+BINARY_SUFFIX = ".npy"
+
+def format_distance(distance):
+    """Odległość jak w nazwach plików: co najmniej 4 miejsca po przecinku."""
+    text = np.format_float_positional(distance, unique=True, trim='k', min_digits=4)
+    return text.rjust(DISTANCE_WIDTH)
+
+def scan_to_table(scan: PESScan):
+    """Tablica (n_distances, 1 + n_states): odległość, potem energie stanów."""
+    return np.column_stack([scan.distances, scan.energies])
+
+def table_to_scan(table, state_nums=None):
+    """Buduje PESScan z tablicy tabeli PES (brak symetrii i Abs_M).
+
+    Tabela nie zawiera numerów stanów, domyślnie kolumny to stany 1..n.
+    """
+    table = np.asarray(table, dtype=np.float64)
+    if state_nums is None:
+        state_nums = np.arange(1, table.shape[1])
+    scan = PESScan.empty(table[:, 0], state_nums)
+    scan.energies[:] = table[:, 1:]
+    return scan
+
+def write_pes_table(path, scan: PESScan):
+    """Zapisuje skan w szerokim formacie tekstowym (jeden wiersz na odległość)."""
+    row_format = "%s" + FIRST_ENERGY_FORMAT + ENERGY_FORMAT * (scan.n_states - 1)
+    lines = [row_format % (format_distance(distance), *energies)
+             for distance, energies in zip(scan.distances.tolist(), scan.energies.tolist())]
+    with open(path, 'w') as f:
+        f.write(PES_TABLE_HEADER + "\n")
+        f.write("\n".join(lines) + "\n")
+
+def write_pes_binary(path, scan: PESScan):
+    """Zapisuje skan jako .npy o układzie tabeli tekstowej."""
+    np.save(path, scan_to_table(scan))
+
+def export_pes_table(path, db_name="molcas_results.db"):
+    """Eksportuje tabelę calculations do formatu tabeli PES.
+
+    Format wybierany jest po rozszerzeniu: .npy zapisuje wersję binarną,
+    każde inne tekstową. Zwraca wyeksportowany skan.
+    """
+    scan = PESScan.from_database(db_name)
+    if path.endswith(BINARY_SUFFIX):
+        write_pes_binary(path, scan)
+    else:
+        write_pes_table(path, scan)
+    return scan
+
+def load_pes_table(path, mmap=False):
+    """Wczytuje tabelę PES (tekstową lub .npy) jako tablicę (n_distances, 1 + n_states).
+
+    Plik tekstowy czytany jest jednym wywołaniem np.loadtxt (parser w C),
+    plik .npy przy mmap=True jest mapowany z dysku bez kopiowania.
+    """
+    if path.endswith(BINARY_SUFFIX):
+        return np.load(path, mmap_mode='r' if mmap else None)
+    return np.loadtxt(path, comments='#', dtype=np.float64, ndmin=2)
+
+def load_pes_scan(path, state_nums=None):
+    """Wczytuje tabelę PES bezpośrednio jako PESScan (bez SQLite)."""
+    return table_to_scan(load_pes_table(path), state_nums)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Eksport tabeli PES z bazy wyników")
+    parser.add_argument("output", help="plik wynikowy (.npy - format binarny)")
+    parser.add_argument("--db", default="molcas_results.db", help="baza wyników")
+    args = parser.parse_args()
+
+    scan = export_pes_table(args.output, args.db)
+    print(f"Zapisano {scan.n_distances} odległości × {scan.n_states} stanów do "
+          f"{os.path.abspath(args.output)}")
@@ -1,34 +1,30 @@
-import sqlite3
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.ticker import MultipleLocator
 from matplotlib.lines import Line2D
+from matplotlib.collections import LineCollection
+from pes_scan import PESScan
+from crossings import load_crossings, plot_crossings
+from profiling import get_profiler, profiling_from_env
 
 def fetch_state_data(db_path="molcas_results.db", target_states=[48]):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT distance FROM calculations ORDER BY distance")
-    distances = [round(row[0], 4) for row in cursor.fetchall()]
-
-    energy_data = {}
-    multiplicities = {}
-
-    for state in target_states:
-        cursor.execute("""
-        SELECT distance, energy, multiplicity 
-        FROM calculations 
-        WHERE state_num = ?
-        ORDER BY distance
-        """, (state,))
-        energy_data[state] = {}
-        multiplicities[state] = None
-        for d, e, m in cursor.fetchall():
-            energy_data[state][d] = e
-            if m is not None:
-                multiplicities[state] = m
-
-    conn.close()
-    return distances, energy_data, multiplicities
+    """Pobiera energie wybranych stanów jednym zapytaniem.
+
+    Zwraca (odległości, energie (n_odległości, n_stanów), numery stanów,
+    multipletowości stanów); brakujące energie to NaN, nieznana
+    multipletowość to 0.
+    """
+    scan = PESScan.from_database(db_path, states=target_states)
+    distances = np.round(scan.distances, 4)
+    if scan.n_distances == 0:
+        return distances, scan.energies, scan.state_nums, np.zeros(scan.n_states, dtype=np.int64)
+
+    # Multipletowość stanu z ostatniej odległości, w której jest znana
+    known = scan.multiplicity != 0
+    last_row = scan.n_distances - 1 - np.argmax(known[::-1], axis=0)
+    multiplicities = scan.multiplicity[last_row, np.arange(scan.n_states)]
+
+    return distances, scan.energies, scan.state_nums, multiplicities
 
 def get_color_by_multiplicity(multiplicity):
     if multiplicity == 1:
@@ -40,63 +36,48 @@ def get_color_by_multiplicity(multiplicity):
     else:
         return 'gray'
 
-def plot_state_energies(states_to_plot=[48], save_path="state_energies.png"):
-    distances, energies, multiplicities = fetch_state_data(target_states=states_to_plot)
-    
-    fig, ax = plt.subplots(figsize=(14, 10))
-
-    all_energies = []
-    for state_data in energies.values():
-        all_energies.extend(state_data.values())
+def plot_state_energies(states_to_plot=[48], save_path="state_energies.png",
+                        label_states=False, show=True, dpi=300, db_path="molcas_results.db",
+                        crossings=False):
+    profiler = get_profiler()
+    with profiler.stage("fetch"):
+        distances, energies, state_nums, multiplicities = fetch_state_data(db_path, target_states=states_to_plot)
 
-    if not all_energies:
+    if energies.size == 0 or np.all(np.isnan(energies)):
         print("Brak danych energetycznych do wykresu.")
         return
 
-    E_min = min(all_energies)
+    fig, ax = plt.subplots(figsize=(14, 10))
+
+    E_min = np.nanmin(energies)
     y_min = -150
     y_max = -146
     print(f"Skala osi Y: od {y_min:.3f} do {y_max:.3f} Hartree (E_min = {E_min:.6f})")
 
-    for i, state in enumerate(states_to_plot):
-        x = []
-        y = []
-        for d in distances:
-            if d in energies[state]:
-                x.append(d)
-                y.append(energies[state][d])
-
-        if not x or not y:
-            continue
-
-        multiplicity = multiplicities.get(state)
-        color = get_color_by_multiplicity(multiplicity)
-        label = f"Stan {state} (M={multiplicity})"
-
-        ax.plot(
-            x, y,
-            'o-',
-            color=color,
-            label=label,
-            markersize=3,
-            linewidth=1.2,
-            alpha=0.8
-        )
-
-        x_pos = x[-1]
-        y_pos = y[-1]
-        offset_y = 0.15 * ((i % 6) - 3)
-
-        ax.annotate(
-            f"{state} (M={multiplicity})",
-            xy=(x_pos, y_pos),
-            xytext=(x_pos + 0.5, y_pos + offset_y),
-            textcoords='data',
-            arrowprops=dict(arrowstyle='->', lw=0.7, color=color, alpha=0.6),
-            fontsize=8,
-            color=color,
-            alpha=0.9
-        )
+    # Jedna krzywa na stan (bez brakujących punktów), wszystkie w jednej kolekcji
+    present = ~np.isnan(energies)
+    has_data = present.any(axis=0)
+    segments = [np.column_stack((distances[present[:, i]], energies[present[:, i], i]))
+                for i in np.flatnonzero(has_data)]
+    colors = np.array([get_color_by_multiplicity(m) for m in multiplicities.tolist()])
+
+    ax.add_collection(LineCollection(segments, colors=colors[has_data],
+                                     linewidths=1.2, alpha=0.8))
+    points_x = np.broadcast_to(distances[:, None], energies.shape)[present]
+    points_colors = np.broadcast_to(colors, energies.shape)[present]
+    ax.scatter(points_x, energies[present], s=9, c=points_colors, alpha=0.8, linewidths=0)
+
+    # Przecięcia między rysowanymi stanami z tabeli crossings (crossings.py)
+    crossing_artists = []
+    if crossings:
+        crossing_artists = plot_crossings(ax, load_crossings(db_path), states_to_plot)
+
+    if label_states:
+        # Numer stanu przy ostatnim punkcie krzywej
+        for segment, state, color in zip(segments, state_nums[has_data].tolist(),
+                                         colors[has_data].tolist()):
+            ax.text(segment[-1, 0] + 0.1, segment[-1, 1], str(state),
+                    fontsize=7, color=color, va='center')
 
     ax.set_ylim(y_min, y_max)
     ax.set_title('Energie stanów w funkcji odległości', pad=20)
@@ -106,17 +87,6 @@ def plot_state_energies(states_to_plot=[48], save_path="state_energies.png"):
     ax.set_xticks(np.arange(0, max(distances) + 0.5, 0.5))
     ax.xaxis.set_minor_locator(MultipleLocator(0.1))
 
-    legend1 = ax.legend(
-        title="Numery i multipletowość stanów",
-        loc='upper center',
-        bbox_to_anchor=(0.5, -0.1),  # legenda wyżej
-        ncol=6,
-        fontsize='small',
-        title_fontsize='medium',
-        frameon=False
-    )
-    ax.add_artist(legend1)
-
     color_legend_elements = [
         Line2D([0], [0], color='blue', lw=2, label='Singlet (M=1)'),
         Line2D([0], [0], color='green', lw=2, label='Triplet (M=3)'),
@@ -124,7 +94,7 @@ def plot_state_energies(states_to_plot=[48], save_path="state_energies.png"):
         Line2D([0], [0], color='gray', lw=2, label='Inne / brak danych')
     ]
     ax.legend(
-        handles=color_legend_elements,
+        handles=color_legend_elements + crossing_artists,
         title="Kolory wg multipletowości",
         loc='center left',
         bbox_to_anchor=(1.02, 0.5),
@@ -133,10 +103,17 @@ def plot_state_energies(states_to_plot=[48], save_path="state_energies.png"):
         frameon=False
     )
 
-    plt.subplots_adjust(bottom=0.2, right=0.82)
+    plt.subplots_adjust(right=0.82)
 
-    plt.savefig(save_path, dpi=300, bbox_inches='tight')
-    plt.show()
+    with profiler.stage("savefig"):
+        fig.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    if show:
+        plt.show()
+    plt.close(fig)
 
 if __name__ == "__main__":
-    plot_state_energies(states_to_plot=list(range(1, 99)))
+    report_path = profiling_from_env()
+    with get_profiler().stage("plot"):
+        plot_state_energies(states_to_plot=list(range(1, 99)), show=report_path is None)
+    if report_path is not None:
+        get_profiler().write_report(report_path)
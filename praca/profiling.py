@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Zmienne środowiskowe włączające profilowanie bez zmiany wywołania
+PROFILE_ENV = "PRACA_PROFILE"          # ścieżka raportu JSON
+PROFILE_DIR_ENV = "PRACA_PROFILE_DIR"  # folder na zrzuty cProfile (.pstats)
+
+# Liczba najwolniejszych plików wypisywanych osobno w raporcie
+SLOWEST_FILES = 10
+
+def peak_rss_kib():
+    """Szczytowe RSS (KiB) tego procesu i jego zakończonych procesów potomnych."""
+    if resource is None:
+        return None, None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def _rate(amount, seconds):
+    """Przepustowość; None, gdy etap nic nie zliczał."""
+    return amount / seconds if amount and seconds > 0 else None
+
+class Profiler:
+    """Zbiera czasy etapów, czasy parsowania plików i liczniki wierszy/bajtów.
+
+    Wyłączony profiler (domyślny) nic nie mierzy, więc etapy można
+    oznaczać w kodzie na stałe.
+    """
+
+    def __init__(self, enabled=False, pstats_dir=None):
+        self.enabled = enabled
+        self.pstats_dir = pstats_dir
+        self.stages = {}
+        self.files = []
+        self._profiles = {}
+        self._profiling = False
+        self._started = time.perf_counter()
+
+    def _stage_entry(self, name):
+        return self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                             'rows': 0, 'bytes': 0})
+
+    @contextmanager
+    def stage(self, name):
+        """Mierzy czas bloku jako etap name (wywołania tego samego etapu się sumują).
+
+        Przy ustawionym pstats_dir etap zewnętrzny jest też profilowany
+        przez cProfile (etapy zagnieżdżone tylko mierzone).
+        """
+        if not self.enabled:
+            yield
+            return
+        profile = None
+        if self.pstats_dir is not None and not self._profiling:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            entry = self._stage_entry(name)
+            entry['calls'] += 1
+            entry['wall_s'] += wall
+            entry['cpu_s'] += cpu
+
+    def count(self, name, rows=0, nbytes=0):
+        """Dodaje przetworzone wiersze i bajty do liczników etapu."""
+        if self.enabled:
+            entry = self._stage_entry(name)
+            entry['rows'] += rows
+            entry['bytes'] += nbytes
+
+    def record_file(self, path, seconds, nbytes):
+        """Zapisuje czas parsowania jednego pliku."""
+        if self.enabled:
+            self.files.append({'file': os.path.basename(path), 'seconds': seconds,
+                               'bytes': nbytes})
+
+    def report(self):
+        """Raport w postaci słownika gotowego do zapisu jako JSON."""
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(entry, rows_per_s=_rate(entry['rows'], entry['wall_s']),
+                                bytes_per_s=_rate(entry['bytes'], entry['wall_s']))
+        parse_seconds = sum(f['seconds'] for f in self.files)
+        parse_bytes = sum(f['bytes'] for f in self.files)
+        rss, rss_children = peak_rss_kib()
+        return {
+            'total_wall_s': time.perf_counter() - self._started,
+            'peak_rss_kib': rss,
+            'peak_rss_children_kib': rss_children,
+            'stages': stages,
+            'files': {
+                'count': len(self.files),
+                'parse_s': parse_seconds,
+                'bytes': parse_bytes,
+                'bytes_per_s': _rate(parse_bytes, parse_seconds),
+                'slowest': sorted(self.files, key=lambda f: f['seconds'],
+                                  reverse=True)[:SLOWEST_FILES],
+                'per_file': self.files,
+            },
+        }
+
+    def write_report(self, path):
+        """Zapisuje raport JSON i zrzuty cProfile (<pstats_dir>/<etap>.pstats)."""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.pstats_dir is not None:
+            os.makedirs(self.pstats_dir, exist_ok=True)
+            for name, profile in self._profiles.items():
+                profile.dump_stats(os.path.join(self.pstats_dir, f"{name}.pstats"))
+
+_profiler = Profiler()
+
+def get_profiler():
+    """Bieżący (globalny) profiler."""
+    return _profiler
+
+def enable_profiling(pstats_dir=None):
+    """Włącza globalny profiler i go zwraca."""
+    global _profiler
+    _profiler = Profiler(enabled=True, pstats_dir=pstats_dir)
+    return _profiler
+
+def profiling_from_env(report_path=None, pstats_dir=None):
+    """Włącza profilowanie, jeśli podano ścieżkę raportu lub ustawiono PRACA_PROFILE.
+
+    Zwraca ścieżkę raportu albo None, gdy profilowanie jest wyłączone.
+    """
+    report_path = report_path or os.environ.get(PROFILE_ENV)
+    if not report_path:
+        return None
+    enable_profiling(pstats_dir or os.environ.get(PROFILE_DIR_ENV))
+    return report_path
@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import signal
+import socket
+import stat
+import logging
+import argparse
+import http.client
+import socketserver
+from collections import OrderedDict
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+import numpy as np
+from pes_scan import PESScan
+from database import connect
+from log_setup import setup_logging, verbosity_level, add_logging_arguments
+
+logger = logging.getLogger("query_service")
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Liczba wycinków trzymanych w pamięci
+CACHE_ENTRIES = 256
+
+def _list(values):
+    """Tablica → lista dla JSON (NaN jako null)."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+def curves_by_state(scan: PESScan, states):
+    """Krzywe energii wybranych stanów: (odległości, stany, energie (n_odl, n_stanów))."""
+    columns = scan.state_index(np.asarray(states, dtype=np.int64))
+    return {'distances': scan.distances, 'state_nums': scan.state_nums[columns],
+            'energies': scan.energies[:, columns]}
+
+def curves_by_symmetry(scan: PESScan, abs_m=None, multiplicity=None, irrep=None):
+    """Krzywe stanów o zadanej symetrii; punkty o innej symetrii to NaN."""
+    mask = scan.symmetry_mask(abs_m, multiplicity, irrep)
+    columns = mask.any(axis=0)
+    return {'distances': scan.distances, 'state_nums': scan.state_nums[columns],
+            'energies': scan.masked_energies(mask)[:, columns]}
+
+def energies_at_distance(scan: PESScan, distance):
+    """Energie i symetrie wszystkich stanów w najbliższej odległości skanu."""
+    if scan.n_distances == 0:
+        raise KeyError("Brak odległości w skanie")
+    row = int(np.argmin(np.abs(scan.distances - distance)))
+    return {'distance': scan.distances[row], 'state_nums': scan.state_nums,
+            'energies': scan.energies[row], 'abs_m': scan.abs_m[row],
+            'multiplicity': scan.multiplicity[row], 'irrep': scan.irrep[row]}
+
+def _ints(params, name):
+    return [int(v) for value in params.get(name, []) for v in value.split(",") if v]
+
+def _required_ints(params, name):
+    values = _ints(params, name)
+    if not values:
+        raise ValueError(f"brak parametru {name}")
+    return values
+
+def _optional(params, name, cast):
+    return cast(params[name][0]) if name in params else None
+
+# Endpoint → (funkcja wycinka, argumenty z parametrów zapytania)
+ENDPOINTS = {
+    '/curves/state': (curves_by_state, lambda p: {'states': _required_ints(p, 'states')}),
+    '/curves/symmetry': (curves_by_symmetry, lambda p: {
+        'abs_m': _optional(p, 'abs_m', float),
+        'multiplicity': _optional(p, 'multiplicity', int),
+        'irrep': _optional(p, 'irrep', int)}),
+    '/energies': (energies_at_distance, lambda p: {'distance': float(p['distance'][0])}),
+}
+
+class SliceCache:
+    """LRU wycinków skanu (słowników tablic NumPy) wraz z gotową odpowiedzią JSON.
+
+    Skan wczytywany jest z bazy raz; przy każdym zapytaniu sprawdzane jest
+    PRAGMA data_version, które zmienia się po zatwierdzeniu zapisu przez inne
+    połączenie (main.py, watch.py), więc wczytanie nowych plików unieważnia
+    cache bez dodatkowej koordynacji.
+    """
+
+    def __init__(self, db_name="molcas_results.db", max_entries=CACHE_ENTRIES):
+        self.db_name = db_name
+        self.max_entries = max_entries
+        self._conn = connect(db_name, readonly=True)
+        self._entries = OrderedDict()
+        self._scan = None
+        self._version = None
+        self.hits = self.misses = self.invalidations = 0
+
+    def _check_version(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            if self._version is not None:
+                logger.info("Baza zmieniona - czyszczę cache")
+                self.invalidate()
+            self._version = version
+
+    def invalidate(self):
+        self._entries.clear()
+        self._scan = None
+        self.invalidations += 1
+
+    def scan(self):
+        if self._scan is None:
+            self._scan = PESScan.from_database(self.db_name)
+        return self._scan
+
+    def get(self, key, compute):
+        """(wycinek, JSON) dla klucza; compute(scan) liczy wycinek przy braku w cache."""
+        self._check_version()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        arrays = compute(self.scan())
+        body = json.dumps({name: _list(values) for name, values in arrays.items()}).encode()
+        self._entries[key] = (arrays, body)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return arrays, body
+
+    def stats(self):
+        self._check_version()
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations, 'data_version': self._version}
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Endpointy: GET /curves/state?states=1,48, /curves/symmetry?abs_m=0&multiplicity=3,
+    /energies?distance=0.6 (najbliższa odległość skanu), /stats; POST /invalidate.
+    """
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        cache = self.server.cache
+        if url.path == '/stats':
+            return self._send(200, json.dumps(cache.stats()).encode())
+        if url.path not in ENDPOINTS:
+            return self._error(404, f"nieznany endpoint {url.path}")
+
+        function, arguments = ENDPOINTS[url.path]
+        try:
+            kwargs = arguments(parse_qs(url.query))
+        except (KeyError, ValueError) as e:
+            return self._error(400, f"błędne parametry: {e}")
+        key = (url.path, tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                                      for k, v in kwargs.items())))
+        try:
+            _, body = cache.get(key, lambda scan: function(scan, **kwargs))
+        except KeyError as e:
+            return self._error(404, str(e.args[0]))
+        self._send(200, body)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/invalidate':
+            return self._error(404, "nieznany endpoint")
+        self.server.cache.invalidate()
+        self._send(200, b'{"invalidated": true}')
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+class QueryServer(HTTPServer):
+    """Serwer HTTP (jednowątkowy) z cache wycinków."""
+
+    def __init__(self, address, cache):
+        super().__init__(address, QueryHandler)
+        self.cache = cache
+
+class UnixQueryServer(socketserver.UnixStreamServer):
+    """Ten sam protokół HTTP na gnieździe uniksowym."""
+
+    def __init__(self, path, cache):
+        if os.path.exists(path):
+            # Usuwamy tylko pozostałość po poprzednim serwisie, nigdy zwykły plik
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise FileExistsError(f"{path} istnieje i nie jest gniazdem")
+            os.remove(path)
+        super().__init__(path, QueryHandler)
+        self.cache = cache
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+def query(endpoint, socket_path=None, host=HOST, port=PORT, **params):
+    """Klient (np. dla notebooków): wynik endpointu jako słownik tablic NumPy.
+
+    query('/curves/state', states='1,48')['energies'] → tablica (n_odl, 2).
+    """
+    conn = _UnixHTTPConnection(socket_path) if socket_path else \
+        http.client.HTTPConnection(host, port)
+    try:
+        conn.request("GET", f"{endpoint}?{urlencode(params)}")
+        response = conn.getresponse()
+        data = json.loads(response.read())
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"{response.status}: {data.get('error')}")
+    arrays = {}
+    for name, values in data.items():
+        if isinstance(values, list):
+            values = np.array(values)
+            # null (NaN) daje tablicę obiektów
+            if values.dtype == object:
+                values = values.astype(np.float64)
+        arrays[name] = values
+    return arrays
+
+def serve(db_name="molcas_results.db", host=HOST, port=PORT, socket_path=None,
+          max_entries=CACHE_ENTRIES):
+    cache = SliceCache(db_name, max_entries)
+    if socket_path:
+        server = UnixQueryServer(socket_path, cache)
+        logger.info("Nasłuchuję na gnieździe %s", socket_path)
+    else:
+        server = QueryServer((host, port), cache)
+        logger.info("Nasłuchuję na http://%s:%d", host, port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokalny serwis zapytań o krzywe PES")
+    parser.add_argument("--db", default="molcas_results.db")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--socket", default=None, help="gniazdo uniksowe zamiast TCP")
+    parser.add_argument("--cache-entries", type=int, default=CACHE_ENTRIES)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(verbosity_level(args.verbose, args.quiet), args.log_json)
+    # SIGTERM kończy serwis jak Ctrl+C (usunięcie gniazda w serve)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.db, args.host, args.port, args.socket, args.cache_entries)
+    except FileExistsError as e:
+        raise SystemExit(str(e))
+    except KeyboardInterrupt:
+        logger.info("Serwis zatrzymany")
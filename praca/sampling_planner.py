@@ -0,0 +1,195 @@
+import os
+import glob
+import heapq
+import logging
+import numpy as np
+from scipy.interpolate import CubicSpline
+from pes_scan import PESScan
+from file_parser import read_module_seconds
+from crossings import DEGENERACY_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+# Czas RASSI na punkt, gdy w plikach nie ma stopki z czasem (s)
+DEFAULT_POINT_SECONDS = 40
+# Docelowy błąd interpolacji liniowej (Hartree)
+TOLERANCE = 1e-4
+# Stany bliżej siebie niż ten próg uznajemy za prawie zdegenerowane (Hartree)
+DEGENERACY_THRESHOLD = 1e-3
+# Mnożnik priorytetu przedziału, w którym wszystkie stany są prawie zdegenerowane/krzyżują się
+DEGENERACY_WEIGHT = 4.0
+# Liczba przedziałów analizowanych naraz przy szukaniu par zbliżających się stanów
+INTERVAL_CHUNK = 16
+# Najmniejszy sensowny odstęp nowego punktu od istniejących (Å)
+MIN_SPACING = 0.005
+# Precyzja nowych odległości (jak w nazwach plików, np. 0.60376)
+DISTANCE_DECIMALS = 5
+
+def point_cost_seconds(data_dir="dane"):
+    """Średni czas RASSI na geometrię ze stopek „Module rassi spent” w data_dir."""
+    seconds = [read_module_seconds(p) for p in glob.glob(os.path.join(data_dir, "*.rassi.output"))]
+    seconds = [s for s in seconds if s is not None]
+    return float(np.mean(seconds)) if seconds else float(DEFAULT_POINT_SECONDS)
+
+def complete_states(scan, states=None, energy_window=None):
+    """Maska kolumn skanu: stany z energią w każdej odległości (opcjonalnie wybrane).
+
+    energy_window ogranicza planowanie do stanów, których minimum leży
+    najwyżej tyle Hartree nad minimum globalnym.
+    """
+    mask = ~np.isnan(scan.energies).any(axis=0)
+    if states is not None:
+        mask &= np.isin(scan.state_nums, states)
+    if energy_window is not None:
+        minima, _ = scan.minima()
+        mask &= minima <= np.nanmin(minima) + energy_window
+    return mask
+
+def interval_metrics(distances, energies, degeneracy_threshold=DEGENERACY_THRESHOLD,
+                     tolerance=DEGENERACY_TOLERANCE, interval_chunk=INTERVAL_CHUNK):
+    """Miary jakości siatki dla każdego przedziału [d_i, d_i+1], liczone naraz dla wszystkich stanów.
+
+    energies ma kształt (n_distances, n_states). Zwraca słownik tablic
+    (n_distances - 1,):
+      interpolation_error – max po stanach |spline − interpolacja liniowa| w środku przedziału,
+      curvature           – max po stanach |E''| na końcach przedziału (Hartree/Å²),
+      curvature_error     – oszacowanie błędu interpolacji liniowej h²/8·|E''|,
+      degenerate_fraction – udział stanów, które w przedziale zbliżają się do innego
+                            stanu (lub od niego oddalają) na mniej niż
+                            degeneracy_threshold albo przecinają się z nim
+                            (zmiana znaku różnicy większej niż tolerance).
+    Pary prawie zdegenerowane na obu końcach przedziału są pomijane.
+    Przedziały analizowane są porcjami po interval_chunk (pamięć ~ chunk·n²).
+    """
+    h = np.diff(distances)
+    mids = distances[:-1] + h / 2
+    spline = CubicSpline(distances, energies, axis=0)
+    linear = (energies[:-1] + energies[1:]) / 2
+    interpolation_error = np.abs(spline(mids) - linear).max(axis=1)
+
+    second = np.abs(spline(distances, 2))
+    curvature = np.maximum(second[:-1], second[1:]).max(axis=1)
+    curvature_error = h ** 2 / 8 * curvature
+
+    degenerate = np.zeros((len(h), energies.shape[1]), dtype=bool)
+    for start in range(0, len(h), interval_chunk):
+        stop = min(start + interval_chunk, len(h))
+        e0, e1 = energies[start:stop], energies[start + 1:stop + 1]
+        # Różnice energii wszystkich par stanów na obu końcach przedziałów (c, n, n)
+        d0 = e0[:, :, None] - e0[:, None, :]
+        d1 = e1[:, :, None] - e1[:, None, :]
+        gap0, gap1 = np.abs(d0), np.abs(d1)
+        # Pary zdegenerowane na obu końcach (np. składowe Π) nie niosą informacji;
+        # liczy się zbliżenie lub rozejście pary w przedziale
+        transient = (gap0 < degeneracy_threshold) != (gap1 < degeneracy_threshold)
+        # Zmiana kolejności pary tylko przy różnicy energii większej niż szum
+        crossing = (np.signbit(d0) != np.signbit(d1)) & (np.maximum(gap0, gap1) >= tolerance)
+        degenerate[start:stop] = (transient | crossing).any(axis=2)
+    return {
+        'interpolation_error': interpolation_error,
+        'curvature': curvature,
+        'curvature_error': curvature_error,
+        'degenerate_fraction': degenerate.mean(axis=1),
+    }
+
+def plan_new_distances(distances, energies, max_points=20, tolerance=TOLERANCE,
+                       degeneracy_threshold=DEGENERACY_THRESHOLD,
+                       degeneracy_weight=DEGENERACY_WEIGHT, min_spacing=MIN_SPACING):
+    """Ranking nowych odległości do policzenia (najważniejsze pierwsze).
+
+    Priorytet przedziału to oszacowany błąd interpolacji (większy z błędu
+    spline−liniowa i h²/8·|E''|) powiększony o (1 + waga·udział degeneracji).
+    Zachłannie dzielimy przedział o najwyższym priorytecie w połowie; każda
+    połówka dziedziczy błąd/4 (błąd interpolacji liniowej ~ h²). Planowanie
+    kończy się po max_points punktach albo gdy priorytet spadnie poniżej tolerance.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    metrics = interval_metrics(distances, energies, degeneracy_threshold)
+    error = np.maximum(metrics['interpolation_error'], metrics['curvature_error'])
+    boost = 1 + degeneracy_weight * metrics['degenerate_fraction']
+
+    heap = [(-e * b, left, right, e, b, i)
+            for i, (e, b, left, right) in enumerate(zip(error.tolist(), boost.tolist(),
+                                                        distances[:-1].tolist(),
+                                                        distances[1:].tolist()))]
+    heapq.heapify(heap)
+    plan = []
+    while heap and len(plan) < max_points:
+        priority, left, right, e, b, interval = heapq.heappop(heap)
+        if -priority < tolerance:
+            break
+        new = round((left + right) / 2, DISTANCE_DECIMALS)
+        if min(new - left, right - new) < min_spacing:
+            continue
+        plan.append({
+            'distance': new,
+            'priority': -priority,
+            'error': e,
+            'degenerate_fraction': metrics['degenerate_fraction'][interval],
+            'curvature': metrics['curvature'][interval],
+            'interval': (left, right),
+        })
+        for lo, hi in ((left, new), (new, right)):
+            heapq.heappush(heap, (-e / 4 * b, lo, hi, e / 4, b, interval))
+    return plan
+
+def plan_from_database(db_name="molcas_results.db", states=None, energy_window=None, **kwargs):
+    """Planuje nowe geometrie na podstawie skanu zapisanego w bazie."""
+    scan = PESScan.from_database(db_name)
+    mask = complete_states(scan, states, energy_window)
+    skipped = int(np.isnan(scan.energies).any(axis=0).sum())
+    if skipped:
+        logger.info("Pominięto stany bez energii we wszystkich odległościach",
+                    extra={'states_skipped': skipped})
+    if scan.n_distances < 3 or not mask.any():
+        return []
+    return plan_new_distances(scan.distances, scan.energies[:, mask], **kwargs)
+
+def print_plan(plan, point_seconds):
+    print(f"{'nr':>3} {'odległość':>10} {'priorytet':>12} {'błąd [mHa]':>11} "
+          f"{'degeneracja':>12} {'przedział':>20}")
+    for rank, entry in enumerate(plan, start=1):
+        left, right = entry['interval']
+        print(f"{rank:3d} {entry['distance']:10.5f} {entry['priority']:12.3e} "
+              f"{entry['error'] * 1000:11.4f} {entry['degenerate_fraction']:12.2f} "
+              f"{left:9.5f}–{right:<10.5f}")
+    hours = len(plan) * point_seconds / 3600
+    print(f"\nNowe punkty: {len(plan)}, szacowany koszt: {hours:.2f} h RASSI "
+          f"({point_seconds:.0f} s/punkt)")
+
+if __name__ == "__main__":
+    import argparse
+    from log_setup import setup_logging, verbosity_level, add_logging_arguments
+    parser = argparse.ArgumentParser(description="Planowanie nowych geometrii skanu PES")
+    parser.add_argument("--db", default="molcas_results.db")
+    parser.add_argument("--data-dir", default="dane", help="pliki RASSI (czas obliczeń ze stopek)")
+    parser.add_argument("-n", "--max-points", type=int, default=20)
+    parser.add_argument("--budget-hours", type=float,
+                        help="maksymalny czas RASSI na nowe punkty (ogranicza --max-points)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="docelowy błąd interpolacji (Hartree)")
+    parser.add_argument("--degeneracy-threshold", type=float, default=DEGENERACY_THRESHOLD)
+    parser.add_argument("--degeneracy-weight", type=float, default=DEGENERACY_WEIGHT)
+    parser.add_argument("--min-spacing", type=float, default=MIN_SPACING)
+    parser.add_argument("--states", type=int, nargs='+', help="tylko te stany")
+    parser.add_argument("--energy-window", type=float,
+                        help="tylko stany z minimum w tym oknie nad minimum globalnym (Hartree)")
+    parser.add_argument("-o", "--output", help="zapisz odległości (jedna na linię)")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(verbosity_level(args.verbose, args.quiet), args.log_json)
+
+    point_seconds = point_cost_seconds(args.data_dir)
+    max_points = args.max_points
+    if args.budget_hours is not None:
+        max_points = min(max_points, int(args.budget_hours * 3600 // point_seconds))
+
+    plan = plan_from_database(args.db, states=args.states, energy_window=args.energy_window,
+                              max_points=max_points, tolerance=args.tolerance,
+                              degeneracy_threshold=args.degeneracy_threshold,
+                              degeneracy_weight=args.degeneracy_weight,
+                              min_spacing=args.min_spacing)
+    print_plan(plan, point_seconds)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.writelines(f"{entry['distance']:.{DISTANCE_DECIMALS}f}\n" for entry in plan)
@@ -0,0 +1,115 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+from pes_scan import PESScan
+from database import save_spectroscopic_constants
+
+# Stałe fizyczne (CODATA 2018)
+HARTREE_J = 4.3597447222071e-18
+AMU_KG = 1.66053906660e-27
+SPEED_OF_LIGHT_CM = 2.99792458e10
+
+# Masa zredukowana O2 (16O) w jednostkach atomowych masy
+O2_REDUCED_MASS = 15.99491461957 / 2
+
+# Odległość w nazwach plików to R/2 (położenie atomu względem środka masy) w Å
+DISTANCE_SCALE = 2.0
+
+# Minimalna głębokość studni [Hartree], płytsze minima (szum asymptoty) nie są wiążące
+MIN_WELL_DEPTH = 1e-5
+
+def spline_minima(distances, energies):
+    """Wyznacza najniższe wewnętrzne minimum splajnu każdej kolumny naraz.
+
+    Dla każdego przedziału splajnu kubicznego zerowe pochodnej liczone są
+    analitycznie na współczynnikach PPoly, więc całość to kilka operacji na
+    tablicach (n_przedziałów, n_stanów). Zwraca (r_min, e_min, krzywizna);
+    kolumny bez wewnętrznego minimum mają NaN.
+    """
+    spline = CubicSpline(distances, energies, axis=0)
+    c3, c2, c1, c0 = spline.c  # każde (n_przedziałów, n_stanów)
+    x0 = spline.x[:-1, None]
+    h = np.diff(spline.x)[:, None]
+
+    # E'(t) = 3 c3 t^2 + 2 c2 t + c1, t = x - x0
+    a, b, c = 3 * c3, 2 * c2, c1
+    disc = b * b - 4 * a * c
+    sqrt_disc = np.sqrt(np.where(disc >= 0, disc, np.nan))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roots = np.stack([(-b - sqrt_disc) / (2 * a), (-b + sqrt_disc) / (2 * a)])
+        linear_root = np.where(b != 0, -c / b, np.nan)
+    # Dla a == 0 pochodna jest liniowa
+    roots = np.where(a == 0, linear_root, roots)
+
+    curvature = 6 * c3 * roots + 2 * c2
+    valid = (roots >= 0) & (roots <= h) & (curvature > 0)
+    values = ((c3 * roots + c2) * roots + c1) * roots + c0
+    values = np.where(valid, values, np.inf)
+
+    # Najniższe minimum wśród wszystkich przedziałów i obu pierwiastków
+    n_states = energies.shape[1]
+    flat = values.reshape(-1, n_states)
+    best = np.argmin(flat, axis=0)
+    cols = np.arange(n_states)
+    e_min = flat[best, cols]
+    found = np.isfinite(e_min)
+
+    root_idx, interval_idx = np.unravel_index(best, values.shape[:2])
+    t = roots[root_idx, interval_idx, cols]
+    r_min = np.where(found, x0[interval_idx, 0] + t, np.nan)
+    k = np.where(found, curvature[root_idx, interval_idx, cols], np.nan)
+    return r_min, np.where(found, e_min, np.nan), k
+
+def harmonic_frequency(curvature, reduced_mass=O2_REDUCED_MASS):
+    """Częstość harmoniczna ω_e [cm^-1] z krzywizny [Hartree/Å^2] i masy [u]."""
+    k_si = curvature * HARTREE_J / 1e-20
+    omega = np.sqrt(k_si / (reduced_mass * AMU_KG))
+    return omega / (2 * np.pi * SPEED_OF_LIGHT_CM)
+
+def fit_spectroscopic_constants(scan: PESScan, distance_scale=DISTANCE_SCALE,
+                                reduced_mass=O2_REDUCED_MASS, min_depth=MIN_WELL_DEPTH):
+    """Liczy r_e, E_min, D_e, ω_e i krzywiznę dla wszystkich stanów skanu.
+
+    r_e podawane jest w jednostkach odległości skanu, krzywizna w Hartree/Å^2
+    względem R = distance_scale * odległość. D_e liczone jest względem energii
+    w największej odległości skanu; stan jest wiążący, gdy D_e > min_depth.
+    Stany z brakującymi punktami dostają NaN.
+    """
+    n_states = scan.n_states
+    r_e = np.full(n_states, np.nan)
+    e_min = np.full(n_states, np.nan)
+    curvature = np.full(n_states, np.nan)
+
+    complete = ~np.isnan(scan.energies).any(axis=0)
+    if scan.n_distances >= 3 and complete.any():
+        r, e, k = spline_minima(scan.distances, scan.energies[:, complete])
+        r_e[complete] = r
+        e_min[complete] = e
+        curvature[complete] = k / distance_scale ** 2
+
+    d_e = scan.energies[-1] - e_min
+    omega_e = harmonic_frequency(curvature, reduced_mass)
+    bound = np.isfinite(r_e) & (d_e > min_depth)
+
+    return {
+        'state_nums': scan.state_nums,
+        'r_e': r_e,
+        'e_min': e_min,
+        'd_e': d_e,
+        'omega_e': omega_e,
+        'curvature': curvature,
+        'bound': bound
+    }
+
+def update_spectroscopic_constants(db_name="molcas_results.db"):
+    """Liczy stałe spektroskopowe dla skanu w bazie i zapisuje je do tabeli."""
+    constants = fit_spectroscopic_constants(PESScan.from_database(db_name))
+    save_spectroscopic_constants(constants, db_name)
+    return constants
+
+if __name__ == "__main__":
+    constants = update_spectroscopic_constants()
+    print(f"{'Stan':>5} {'r_e':>9} {'E_min (Eh)':>15} {'D_e (eV)':>9} {'ω_e (cm-1)':>11}")
+    for i in np.flatnonzero(constants['bound']):
+        print(f"{constants['state_nums'][i]:>5} {constants['r_e'][i]:>9.5f} "
+              f"{constants['e_min'][i]:>15.8f} {constants['d_e'][i] * 27.211386:>9.4f} "
+              f"{constants['omega_e'][i]:>11.1f}")
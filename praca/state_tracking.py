@@ -0,0 +1,81 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from pes_scan import PESScan
+from database import save_state_tracking
+
+# Koszt przejścia to kwadrat błędu ekstrapolacji [Hartree^2]; kwadrat (a nie
+# wartość bezwzględna) sprawia, że przy braku przecięć optymalne przypisanie
+# jest jednoznaczne i zachowuje kolejność energii.
+# Kara za połączenie punktów o innym irrep/multipletowości (praktycznie zakaz)
+SYMMETRY_PENALTY = 1e3
+# Kara za zmianę Abs_M wzdłuż krzywej (~ błąd ekstrapolacji 0.03 Hartree)
+ABS_M_PENALTY = 1e-3
+# Kara za brakujący punkt
+MISSING_PENALTY = 1e6
+# Waga liniowej ekstrapolacji nachylenia krzywej (0 = sama ciągłość energii)
+EXTRAPOLATION_WEIGHT = 0.5
+
+def symmetry_codes(scan: PESScan):
+    """Koduje (irrep, multiplicity) każdego punktu skanu jedną liczbą całkowitą."""
+    return scan.irrep * 1000 + scan.multiplicity
+
+def step_costs(predicted, next_energies, codes, next_codes, abs_m, next_abs_m):
+    """Macierz kosztów (krzywe × stany) przejścia do kolejnej odległości."""
+    cost = (predicted[:, None] - next_energies[None, :]) ** 2
+    cost = np.where(np.isnan(cost), MISSING_PENALTY, cost)
+    cost += SYMMETRY_PENALTY * (codes[:, None] != next_codes[None, :])
+    cost += ABS_M_PENALTY * (abs_m[:, None] != next_abs_m[None, :])
+    return cost
+
+def track_states(scan: PESScan, extrapolation_weight=EXTRAPOLATION_WEIGHT):
+    """Łączy stany między sąsiednimi odległościami w ciągłe krzywe.
+
+    Dla każdej pary sąsiednich odległości budowana jest macierz kosztów
+    ((ekstrapolowana energia krzywej - energia stanu)^2 + kary za symetrię)
+    dla wszystkich krzywych i stanów naraz, a przypisanie wyznacza algorytm
+    węgierski (linear_sum_assignment). Energia krzywej jest ekstrapolowana
+    z nachylenia na dwóch poprzednich punktach (z wagą extrapolation_weight),
+    dzięki czemu krzywe przechodzą przez przecięcia zamiast zamieniać się
+    tożsamością.
+
+    Zwraca tablicę (n_distances, n_states) z identyfikatorem krzywej każdego
+    punktu; identyfikatorem jest numer stanu w najmniejszej odległości.
+    """
+    n_distances, n_states = scan.energies.shape
+    codes = symmetry_codes(scan)
+    # columns[i, c] - kolumna (stan), w której krzywa c leży w odległości i
+    columns = np.empty((n_distances, n_states), dtype=np.int64)
+    columns[0] = np.arange(n_states)
+
+    for i in range(n_distances - 1):
+        current = columns[i]
+        energies_now = scan.energies[i, current]
+        predicted = energies_now
+        if i > 0:
+            slope = (energies_now - scan.energies[i - 1, columns[i - 1]]) / \
+                    (scan.distances[i] - scan.distances[i - 1])
+            step = scan.distances[i + 1] - scan.distances[i]
+            predicted = energies_now + extrapolation_weight * np.nan_to_num(slope) * step
+
+        cost = step_costs(predicted, scan.energies[i + 1],
+                          codes[i, current], codes[i + 1],
+                          scan.abs_m[i, current], scan.abs_m[i + 1])
+        curves, states = linear_sum_assignment(cost)
+        columns[i + 1, curves] = states
+
+    curve_ids = np.empty((n_distances, n_states), dtype=np.int64)
+    rows = np.repeat(np.arange(n_distances), n_states)
+    curve_ids[rows, columns.ravel()] = np.tile(scan.state_nums, n_distances)
+    return curve_ids
+
+def update_state_tracking(db_name="molcas_results.db"):
+    """Śledzi stany dla skanu w bazie i zapisuje identyfikatory krzywych."""
+    scan = PESScan.from_database(db_name)
+    curve_ids = track_states(scan)
+    save_state_tracking(scan.distances, scan.state_nums, curve_ids, db_name)
+    return scan, curve_ids
+
+if __name__ == "__main__":
+    scan, curve_ids = update_state_tracking()
+    switched = (curve_ids != scan.state_nums[None, :]).any(axis=0)
+    print(f"Stany zmieniające krzywą w skanie: {int(switched.sum())} z {scan.n_states}")
@@ -0,0 +1,200 @@
+import os
+from typing import List, Dict
+import numpy as np
+from database import (create_database, save_to_database, update_database_with_mapping,
+                      iter_calculation_rows, open_connection, close_connection)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+# Kolumny tabeli calculations dostępne przez fetch (bez klucza id)
+CALCULATION_COLUMNS = ('distance', 'state_num', 'energy', 'abs_m', 'jobiph', 'root',
+                       'irrep', 'multiplicity', 'order_index', 'irrep_index')
+# Kolumny tekstowe; pozostałe zwracane są jako float64 (brak wartości = NaN)
+TEXT_COLUMNS = ('jobiph',)
+
+class StorageBackend:
+    """Interfejs magazynu wyników (tabela calculations).
+
+    fetch zwraca słownik kolumna → tablica NumPy; filtry to listy dopuszczalnych
+    wartości (None = bez filtra).
+    """
+
+    def save_results(self, results: List[Dict]):
+        """Zapisuje wyniki parse_single_file, zastępując dane tych samych odległości."""
+        raise NotImplementedError
+
+    def fetch(self, columns=CALCULATION_COLUMNS, distances=None, states=None,
+              abs_m=None, multiplicity=None, irrep=None) -> Dict[str, np.ndarray]:
+        """Wybrane kolumny wierszy spełniających filtry."""
+        raise NotImplementedError
+
+    def update_mapping(self):
+        """Nadaje order_index i irrep_index; zwraca optymalną odległość."""
+        raise NotImplementedError
+
+def _filters(distances, states, abs_m, multiplicity, irrep):
+    """Pary (kolumna, lista wartości) dla niepustych filtrów."""
+    filters = (('distance', distances), ('state_num', states), ('abs_m', abs_m),
+               ('multiplicity', multiplicity), ('irrep', irrep))
+    return [(column, list(values)) for column, values in filters if values is not None]
+
+def _column_array(column, values):
+    if column in TEXT_COLUMNS:
+        return np.array(values, dtype=object)
+    return np.array([np.nan if value is None else value for value in values],
+                    dtype=np.float64)
+
+class SQLiteBackend(StorageBackend):
+    """Dotychczasowa baza SQLite (funkcje z database.py)."""
+
+    def __init__(self, db_name="molcas_results.db", journal_mode=None, synchronous=None):
+        self.db_name = db_name
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        create_database(db_name)
+
+    def save_results(self, results: List[Dict]):
+        save_to_database(results, self.db_name, self.journal_mode, self.synchronous)
+
+    def fetch(self, columns=CALCULATION_COLUMNS, distances=None, states=None,
+              abs_m=None, multiplicity=None, irrep=None):
+        columns = list(columns)
+        query = f"SELECT {', '.join(columns)} FROM calculations"
+        conditions, params = [], []
+        for column, values in _filters(distances, states, abs_m, multiplicity, irrep):
+            conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        conn = open_connection(self.db_name, readonly=True)
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            close_connection(conn)
+
+        values = zip(*rows) if rows else [()] * len(columns)
+        return {column: _column_array(column, column_values)
+                for column, column_values in zip(columns, values)}
+
+    def update_mapping(self):
+        return update_database_with_mapping(self.db_name)
+
+class ParquetBackend(StorageBackend):
+    """Kolumnowy magazyn Parquet partycjonowany po odległości.
+
+    Każda odległość to katalog distance=<R/2> z jednym plikiem Parquet
+    (partycjonowanie hive), więc zapis pliku wyjściowego podmienia tylko jego
+    partycję. Filtry są przekazywane do pyarrow.dataset: filtr odległości
+    pomija całe katalogi, pozostałe korzystają ze statystyk grup wierszy.
+    """
+
+    def __init__(self, root_dir):
+        if pa is None:
+            raise ImportError("Magazyn Parquet wymaga pakietu pyarrow")
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def partition_path(self, distance):
+        return os.path.join(self.root_dir, f"distance={float(distance)!r}", "part-0.parquet")
+
+    def _write_partition(self, distance, table):
+        path = self.partition_path(distance)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def stored_distances(self):
+        """Odległości, dla których istnieje partycja."""
+        prefix = "distance="
+        return {float(name[len(prefix):]) for name in os.listdir(self.root_dir)
+                if name.startswith(prefix)
+                and os.path.exists(os.path.join(self.root_dir, name, "part-0.parquet"))}
+
+    def _dataset(self):
+        partitioning = ds.partitioning(pa.schema([('distance', pa.float64())]), flavor="hive")
+        return ds.dataset(self.root_dir, format="parquet", partitioning=partitioning,
+                          exclude_invalid_files=True)
+
+    @staticmethod
+    def _partition_table(columns: Dict):
+        """Tabela Arrow partycji (kolumna distance jest w nazwie katalogu)."""
+        schema = pa.schema([('state_num', pa.int64()), ('energy', pa.float64()),
+                            ('abs_m', pa.float64()), ('jobiph', pa.string()),
+                            ('root', pa.int64()), ('irrep', pa.int64()),
+                            ('multiplicity', pa.int64()), ('order_index', pa.int64()),
+                            ('irrep_index', pa.int64())])
+        return pa.table({name: columns.get(name) for name in schema.names}, schema=schema)
+
+    def save_results(self, results: List[Dict]):
+        for result in results:
+            rows = list(iter_calculation_rows(result))
+            _, states, energies, abs_m, jobiph, roots, irreps, multiplicities = \
+                (list(column) for column in zip(*rows)) if rows else [[]] * 8
+            table = self._partition_table({
+                'state_num': states, 'energy': energies, 'abs_m': abs_m,
+                'jobiph': jobiph, 'root': roots, 'irrep': irreps,
+                'multiplicity': multiplicities,
+                'order_index': [None] * len(rows), 'irrep_index': [None] * len(rows)
+            })
+            self._write_partition(result['distance'], table)
+
+    def fetch(self, columns=CALCULATION_COLUMNS, distances=None, states=None,
+              abs_m=None, multiplicity=None, irrep=None):
+        columns = list(columns)
+        if not os.listdir(self.root_dir):
+            return {column: _column_array(column, []) for column in columns}
+
+        expression = None
+        for column, values in _filters(distances, states, abs_m, multiplicity, irrep):
+            condition = ds.field(column).isin(values)
+            expression = condition if expression is None else expression & condition
+
+        table = self._dataset().to_table(columns=columns, filter=expression)
+        return {column: _column_array(column, table.column(column).to_pylist())
+                if column in TEXT_COLUMNS else
+                table.column(column).cast(pa.float64()).to_numpy(zero_copy_only=False)
+                for column in columns}
+
+    def update_mapping(self):
+        """Ta sama numeracja co update_database_with_mapping, liczona w pandas."""
+        data = self._dataset().to_table().to_pandas()
+        if data.empty:
+            return None
+        optimal_distance = data['distance'].iloc[data['energy'].idxmin()]
+
+        # order_index - kolejność energii stanów w optymalnej odległości
+        at_optimum = (data[data['distance'] == optimal_distance]
+                      .groupby('state_num', as_index=False)['energy'].min()
+                      .sort_values(['energy', 'state_num']))
+        order = dict(zip(at_optimum['state_num'], range(1, len(at_optimum) + 1)))
+        data['order_index'] = data['state_num'].map(order).astype('Int64')
+
+        # irrep_index - kolejność energii w obrębie (distance, irrep, multiplicity, abs_m)
+        group = ['distance', 'irrep', 'multiplicity', 'abs_m']
+        ranked = (data.dropna(subset=group[1:])
+                  .groupby(group + ['state_num'], as_index=False)['energy'].min()
+                  .sort_values(group + ['energy', 'state_num']))
+        ranked['irrep_index'] = ranked.groupby(group).cumcount() + 1
+        ranked = ranked.drop_duplicates(['distance', 'state_num'], keep='last')
+        data = data.drop(columns='irrep_index').merge(
+            ranked[['distance', 'state_num', 'irrep_index']],
+            on=['distance', 'state_num'], how='left')
+        data['irrep_index'] = data['irrep_index'].astype('Int64')
+
+        for distance, partition in data.groupby('distance'):
+            columns = {name: partition[name].astype(object).where(partition[name].notna(), None)
+                       .tolist() for name in partition.columns if name != 'distance'}
+            self._write_partition(distance, self._partition_table(columns))
+        return optimal_distance
+
+def open_storage(location, **kwargs):
+    """Otwiera magazyn: pliki *.db to SQLite, pozostałe ścieżki to katalog Parquet."""
+    if location.endswith(".db"):
+        return SQLiteBackend(location, **kwargs)
+    return ParquetBackend(location, **kwargs)
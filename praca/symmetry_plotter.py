@@ -1,10 +1,13 @@
 # symmetry_plotter.py
-import sqlite3
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 from matplotlib.lines import Line2D
 from matplotlib.patches import Patch
+from matplotlib.collections import LineCollection
+from database import connect
+from crossings import load_crossings, plot_crossings
+from profiling import get_profiler, profiling_from_env
 
 # Konfiguracja
 DB_PATH = "molcas_results.db"
@@ -50,11 +53,16 @@ LAMBDA_NAMES = {
     4: 'Γ'
 }
 
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
+# Formaty zapisywane domyślnie przez main()
+OUTPUT_BASENAME = "energy_curves_lambda_and_mult"
+OUTPUT_FORMATS = ("png",)
+
+def get_db_connection(db_path=DB_PATH):
+    # Tylko odczyt: wykres może powstawać w trakcie wczytywania danych
+    return connect(db_path, readonly=True)
 
 def print_state_statistics(db_path=DB_PATH):
-    conn = sqlite3.connect(db_path)
+    conn = get_db_connection(db_path)
     query = """
     SELECT 
         abs_m,
@@ -74,8 +82,8 @@ def print_state_statistics(db_path=DB_PATH):
     print("\nStatystyki stanów wg Λ i multipletowości:")
     print(df[['lambda_name', 'mult_name', 'num_states']].to_string(index=False))
 
-def fetch_data():
-    conn = get_db_connection()
+def fetch_data(db_path=DB_PATH):
+    conn = get_db_connection(db_path)
     query = """
     SELECT distance, state_num, energy, abs_m, multiplicity 
     FROM calculations 
@@ -86,56 +94,51 @@ def fetch_data():
     conn.close()
     return df
 
-def plot_energy_curves(data):
-    plt.figure(figsize=(18, 12))
+def curve_segments(data):
+    """Dzieli dane na krzywe (abs_m, multiplicity, state_num) jednym sortowaniem.
+
+    Zwraca (punkty (n, 2) posortowane po krzywych i odległości, indeksy
+    początków krzywych, tablicę (n_krzywych, 3) z abs_m, multipletowością
+    i numerem stanu każdej krzywej).
+    """
+    data = data.sort_values(['abs_m', 'multiplicity', 'state_num', 'distance'], kind='stable')
+    keys = data[['abs_m', 'multiplicity', 'state_num']].to_numpy()
+    points = data[['distance', 'energy']].to_numpy(dtype=np.float64)
+
+    starts = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]).any(axis=1)])
+    return points, starts, keys[starts].astype(int)
+
+def plot_energy_curves(data, label_states=True):
+    fig = plt.figure(figsize=(18, 12))
     ax = plt.gca()
-    
-    for (abs_m, mult), group in data.groupby(['abs_m', 'multiplicity']):
-        abs_m_int = int(abs_m)
-        mult_int = int(mult)
-        
-        # Kolor głównie zależy od Λ, z lekką modyfikacją dla multipletowości
-        base_color = LAMBDA_COLORS.get(abs_m_int, '#777777')
-        mult_color = MULTIPLICITY_COLORS.get(mult_int, '#cccccc')
-        
-        line_style = MULTIPLICITY_STYLES.get(mult_int, '-')
-        lambda_name = LAMBDA_NAMES.get(abs_m_int, f'Λ={abs_m}')
-        mult_name = MULTIPLICITY_NAMES.get(mult_int, f'M={mult}')
-        
-        for state in group['state_num'].unique():
-            state_data = group[group['state_num'] == state]
-            
-            # Mieszamy kolory Λ i multipletowości
-            line_color = base_color  # Można zmienić na mult_color jeśli wolisz
-            
-            ax.plot(
-                state_data['distance'],
-                state_data['energy'],
-                color=line_color,
-                linestyle=line_style,
-                linewidth=2,
-                marker='o',
-                markersize=5,
-                markeredgecolor='none',
-                alpha=0.8,
-                label=f"{lambda_name} {mult_name}" if state == group['state_num'].min() else ""
-            )
-            
-            # Podpisz końce krzywych
-            last_point = state_data.iloc[-1]
-            ax.text(
-                last_point['distance'] + 0.05,
-                last_point['energy'],
-                f"{lambda_name}-{state} ({mult_name})",
-                color=line_color,
-                fontsize=9,
-                ha='left',
-                va='center'
-            )
+
+    points, starts, curve_keys = curve_segments(data)
+    curve_abs_m, curve_mult, curve_states = curve_keys.T
+    segments = np.split(points, starts[1:])
+    colors = [LAMBDA_COLORS.get(m, '#777777') for m in curve_abs_m.tolist()]
+    styles = [MULTIPLICITY_STYLES.get(m, '-') for m in curve_mult.tolist()]
+
+    # Wszystkie krzywe w jednej kolekcji, wszystkie punkty w jednym scatterze
+    ax.add_collection(LineCollection(segments, colors=colors, linestyles=styles,
+                                     linewidths=2, alpha=0.8))
+    lengths = np.diff(np.r_[starts, len(points)])
+    ax.scatter(points[:, 0], points[:, 1], s=25, c=np.repeat(colors, lengths),
+               linewidths=0, alpha=0.8)
+    ax.autoscale_view()
+
+    if label_states:
+        # Podpisz końce krzywych
+        ends = points[starts + lengths - 1]
+        for (x, y), state, abs_m, mult, color in zip(ends.tolist(), curve_states.tolist(),
+                                                      curve_abs_m.tolist(), curve_mult.tolist(),
+                                                      colors):
+            lambda_name = LAMBDA_NAMES.get(abs_m, f'Λ={abs_m}')
+            mult_name = MULTIPLICITY_NAMES.get(mult, f'M={mult}')
+            ax.text(x + 0.05, y, f"{lambda_name}-{state} ({mult_name})",
+                    color=color, fontsize=9, ha='left', va='center')
 
     # Podwójna legenda
-    from matplotlib.patches import Patch
-    
+
     # Legenda dla Λ (kolor)
     lambda_legend = [Patch(color=color, label=LAMBDA_NAMES[m]) 
                     for m, color in LAMBDA_COLORS.items()]
@@ -162,13 +165,63 @@ def plot_energy_curves(data):
     plt.ylabel("Energia [Hartree]", fontsize=14)
     plt.grid(True, alpha=0.2)
     plt.tight_layout()
+    return fig
+
+def main(db_path=DB_PATH, output=OUTPUT_BASENAME, formats=OUTPUT_FORMATS,
+         headless=False, dpi=300, label_states=True, crossings=False):
+    """Rysuje wykres raz i zapisuje go we wszystkich formatach.
+
+    W trybie headless używany jest backend Agg i plt.show() jest pomijane.
+    Przy crossings=True na wykres nanoszone są przecięcia z tabeli crossings.
+    Zwraca listę zapisanych plików.
+    """
+    profiler = get_profiler()
+    if headless:
+        plt.switch_backend('Agg')
+    with profiler.stage("fetch"):
+        data = fetch_data(db_path)
+    profiler.count("fetch", len(data))
+    with profiler.stage("plot"):
+        fig = plot_energy_curves(data, label_states=label_states)
+        if crossings:
+            ax = fig.axes[0]
+            ax.add_artist(ax.get_legend())
+            ax.legend(handles=plot_crossings(ax, load_crossings(db_path)),
+                      loc='upper center', fontsize=10)
+
+    saved = []
+    for fmt in formats:
+        path = f"{output}.{fmt}"
+        with profiler.stage(f"savefig_{fmt}"):
+            fig.savefig(path, dpi=dpi, bbox_inches='tight')
+        saved.append(path)
+
+    if not headless:
+        plt.show()
+    plt.close(fig)
+    return saved
 
-def main():
-    data = fetch_data()
-    plot_energy_curves(data)
-    plt.savefig("energy_curves_lambda_and_mult.png", dpi=300, bbox_inches='tight')
-    plt.show()
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description="Krzywe energii z podziałem na Λ i multipletowość")
+    parser.add_argument("--db", default=DB_PATH, help="baza wyników")
+    parser.add_argument("--output", default=OUTPUT_BASENAME, help="nazwa pliku bez rozszerzenia")
+    parser.add_argument("--formats", default=",".join(OUTPUT_FORMATS),
+                        help="formaty oddzielone przecinkami, np. png,svg,pdf")
+    parser.add_argument("--headless", action="store_true",
+                        help="bez okna wykresu (np. w nocnym potoku)")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--no-labels", action="store_true", help="bez podpisów końców krzywych")
+    parser.add_argument("--crossings", action="store_true",
+                        help="zaznacz przecięcia z tabeli crossings (python crossings.py)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    print_state_statistics()
-    main()
\ No newline at end of file
+    args = parse_args()
+    report_path = profiling_from_env()
+    print_state_statistics(args.db)
+    saved = main(args.db, args.output, args.formats.split(","), args.headless,
+                 args.dpi, not args.no_labels, args.crossings)
+    print("Zapisano: " + ", ".join(saved))
+    if report_path is not None:
+        get_profiler().write_report(report_path)
\ No newline at end of file
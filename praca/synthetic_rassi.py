@@ -0,0 +1,189 @@
+import os
+import numpy as np
+
+# Parametry domyślne odpowiadają rzeczywistym plikom z dane/
+DEFAULT_STATES = 99
+DEFAULT_JOBIPH = 23
+DEFAULT_TRANSITIONS = 200
+IRREPS = 8
+MULTIPLICITIES = (1, 3, 5)
+# Próg, poniżej którego siła oscylatora w porównaniu cechowań jest „below threshold”
+OSC_THRESHOLD = 1e-5
+# Czas liczenia punktu zapisywany w stopce (jak w prawdziwych wyjściach RASSI)
+MODULE_SECONDS = 40
+STATES_PER_LINE = 20
+VALUES_PER_LINE = 5
+
+def synthetic_filename(distance):
+    """Nazwa pliku w formacie O2.X.YYYY.rassi.output (co najmniej 4 miejsca po przecinku)."""
+    text = np.format_float_positional(distance, unique=True, trim='k', min_digits=4)
+    return f"O2.{text}.rassi.output"
+
+def state_parameters(n_states, n_jobiph=DEFAULT_JOBIPH, seed=0):
+    """Losowe, ale stałe dla całego skanu parametry stanów i plików JOBIPH.
+
+    Każdy stan ma krzywą Morse'a (E_inf, D_e, r_e, a), Abs_M i przypisanie do
+    pliku JOBIPH (kolejne bloki stanów); pliki JOBIPH mają irrep
+    i multipletowość.
+    """
+    rng = np.random.default_rng(seed)
+    jobiph_of_state = np.sort(np.arange(n_states) % n_jobiph)
+    roots = np.zeros(n_states, dtype=np.int64)
+    for j in range(n_jobiph):
+        members = np.flatnonzero(jobiph_of_state == j)
+        roots[members] = np.arange(1, len(members) + 1)
+    return {
+        'e_inf': -149.6 + rng.uniform(0.0, 0.5, n_states),
+        'd_e': rng.uniform(0.0, 0.25, n_states),
+        'r_e': rng.uniform(0.55, 0.9, n_states),
+        'alpha': rng.uniform(2.0, 6.0, n_states),
+        'abs_m': rng.integers(0, 4, n_states).astype(np.float64),
+        'jobiph': jobiph_of_state,
+        'roots': roots,
+        'irrep': np.arange(n_jobiph) // len(MULTIPLICITIES) % IRREPS + 1,
+        'multiplicity': np.array(MULTIPLICITIES)[np.arange(n_jobiph) % len(MULTIPLICITIES)],
+    }
+
+def state_energies(params, distance):
+    """Energie wszystkich stanów w odległości distance (krzywe Morse'a)."""
+    x = np.exp(-params['alpha'] * (distance - params['r_e']))
+    return params['e_inf'] + params['d_e'] * ((1 - x) ** 2 - 1)
+
+def _jobiph_name(index):
+    return "JOBIPH" if index == 0 else f"JOBIPH{index:02d}"
+
+def _jobiph_sections(params):
+    lines = []
+    for j, (irrep, multiplicity) in enumerate(zip(params['irrep'].tolist(),
+                                                  params['multiplicity'].tolist())):
+        lines += [f"   Specific data for JOBIPH file {_jobiph_name(j)}",
+                  "   -------------------------------------", "",
+                  f"  STATE IRREP:          {irrep:6d}",
+                  f"  SPIN MULTIPLICITY:    {multiplicity:6d}",
+                  "  ACTIVE ELECTRONS:         12",
+                  f"  NR OF CONFIG:         {10 + 2 * j:6d}", ""]
+    return lines
+
+def _mapping_lines(params):
+    n_states = len(params['roots'])
+    lines = [f"  Nr of states:           {n_states:8d}", ""]
+    for start in range(0, n_states, STATES_PER_LINE):
+        block = slice(start, start + STATES_PER_LINE)
+        states = np.arange(n_states)[block] + 1
+        lines += ["   State:    " + "".join(f"{s:4d}" for s in states.tolist()),
+                  "  JobIph:    " + "".join(f"{j:4d}" for j in (params['jobiph'][block] + 1).tolist()),
+                  " Root nr:    " + "".join(f"{r:4d}" for r in params['roots'][block].tolist()),
+                  ""]
+    return lines
+
+def _diagonal_block(title, kind, values):
+    lines = [f"  {title}", "", f"  Diagonal, with {kind}"]
+    for start in range(0, len(values), VALUES_PER_LINE):
+        lines.append("".join(f"{v:16.8f}" for v in values[start:start + VALUES_PER_LINE]))
+    return lines + [""]
+
+def _abs_m_table(energies, abs_m):
+    order = np.argsort(energies, kind='stable')
+    relative = energies[order] - energies[order[0]]
+    lines = ["  SPIN-FREE ENERGIES:",
+             f"  (Shifted by EMIN (a.u.) = {energies[order[0]]:20.10f})", "",
+             " SF State       Relative EMIN(au)   Rel lowest level(eV)    D:o, cm**(-1)      L_eff   Abs_M",
+             ""]
+    lines += [f"{state + 1:6d} {rel:24.10f} {rel * 27.211386:20.10f} {rel * 219474.63:19.4f}"
+              f" {1.0:10.1f} {m:8.1f}"
+              for state, rel, m in zip(order.tolist(), relative.tolist(), abs_m[order].tolist())]
+    return lines + [""]
+
+def _transition_rows(rng, n_states, n_transitions):
+    """Losowe przejścia (from, to, f, Ax, Ay, Az, A_total)."""
+    from_states = rng.integers(1, n_states + 1, n_transitions)
+    to_states = rng.integers(1, n_states + 1, n_transitions)
+    osc = 10 ** rng.uniform(-5, -0.5, n_transitions)
+    a = rng.uniform(0, 1e9, (n_transitions, 3)) * (rng.random((n_transitions, 3)) < 0.5)
+    return from_states, to_states, osc, a
+
+def _transition_block(title, from_states, to_states, osc, a):
+    rule = "     " + "-" * 95
+    lines = [f"++ {title} (spin-free states):", "   " + "-" * (len(title) + 20),
+             f"     for osc. strength at least  {OSC_THRESHOLD:.8E}", "",
+             "      From   To        Osc. strength     Einstein coefficients Ax, Ay, Az (sec-1)"
+             "    Total A (sec-1)", rule]
+    lines += [f"{i:10d}{j:5d} {f:20.8E}{ax:16.8E}{ay:16.8E}{az:16.8E}{ax + ay + az:16.8E}"
+              for i, j, f, (ax, ay, az) in zip(from_states.tolist(), to_states.tolist(),
+                                               osc.tolist(), a.tolist())]
+    return lines + [rule, "--", ""]
+
+def _gauge_comparison_block(from_states, to_states, osc_length, osc_velocity):
+    rule = "     " + "-" * 63
+    lines = ["++ Length and velocity gauge comparison (spin-free states):",
+             "   " + "-" * 56, "",
+             "  Problematic transitions have been found", "",
+             "      From   To       Difference (%) Osc. st. (len.) Osc. st. (vel.)", rule]
+    for i, j, fl, fv in zip(from_states.tolist(), to_states.tolist(),
+                            osc_length.tolist(), osc_velocity.tolist()):
+        if fl < OSC_THRESHOLD:
+            lines.append(f"{i:10d}{j:5d}      --------------- below threshold  {fv:.8E}")
+        else:
+            lines.append(f"{i:10d}{j:5d} {abs(1 - fl / fv) * 100:20.6f}  {fl:.8E}  {fv:.8E}")
+    return lines + [rule, "--", ""]
+
+def rassi_output_text(distance, params, n_transitions=DEFAULT_TRANSITIONS, seed=0):
+    """Treść jednego pliku wyjściowego RASSI dla odległości distance."""
+    rng = np.random.default_rng([seed, int(round(distance * 1e6))])
+    energies = state_energies(params, distance)
+    n_states = len(energies)
+
+    lines = ["   This run of MOLCAS is using the pymolcas driver", ""]
+    lines += _jobiph_sections(params)
+    lines += _mapping_lines(params)
+    lines += _diagonal_block("HAMILTONIAN MATRIX FOR THE ORIGINAL STATES:", "energies", energies)
+    lines += _diagonal_block("OVERLAP MATRIX FOR THE ORIGINAL STATES:", "elements",
+                             np.ones(n_states))
+    lines += [f"::    RASSI State {state:4d}     Total energy: {energy:24.14f}"
+              for state, energy in enumerate(energies.tolist(), start=1)]
+    lines += ["", ""] + _abs_m_table(energies, params['abs_m'])
+
+    from_states, to_states, osc, a = _transition_rows(rng, n_states, n_transitions)
+    lines += _transition_block("Dipole transition strengths", from_states, to_states, osc, a)
+    osc_velocity = osc * rng.uniform(0.5, 1.5, n_transitions)
+    lines += _transition_block("Velocity transition strengths", from_states, to_states,
+                               osc_velocity, a)
+    lines += _gauge_comparison_block(from_states, to_states,
+                                     np.where(rng.random(n_transitions) < 0.05, 0.0, osc),
+                                     osc_velocity)
+    lines += ["--- Stop Module: rassi at Thu Apr 17 10:49:07 2025 /rc=_RC_ALL_IS_WELL_ ---",
+              f"--- Module rassi spent {MODULE_SECONDS} seconds ---", ""]
+    return "\n".join(lines)
+
+def generate_scan(out_dir, distances, n_states=DEFAULT_STATES, n_jobiph=DEFAULT_JOBIPH,
+                  n_transitions=DEFAULT_TRANSITIONS, seed=0):
+    """Zapisuje syntetyczne pliki RASSI dla wszystkich odległości; zwraca ich ścieżki."""
+    os.makedirs(out_dir, exist_ok=True)
+    params = state_parameters(n_states, min(n_jobiph, n_states), seed)
+    paths = []
+    for distance in np.asarray(distances, dtype=np.float64).tolist():
+        path = os.path.join(out_dir, synthetic_filename(distance))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(rassi_output_text(distance, params, n_transitions, seed))
+        paths.append(path)
+    return paths
+
+def scan_distances(n_distances, start=0.45, stop=10.0):
+    """n_distances odległości R/2 zaokrąglonych do 5 miejsc (jak w nazwach plików)."""
+    return np.unique(np.round(np.geomspace(start, stop, n_distances), 5))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generator syntetycznych wyjść RASSI")
+    parser.add_argument("out_dir", help="folder na pliki .rassi.output")
+    parser.add_argument("--distances", type=int, default=45, help="liczba geometrii")
+    parser.add_argument("--states", type=int, default=DEFAULT_STATES)
+    parser.add_argument("--jobiph", type=int, default=DEFAULT_JOBIPH)
+    parser.add_argument("--transitions", type=int, default=DEFAULT_TRANSITIONS,
+                        help="liczba wierszy w każdym bloku sił przejść")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = generate_scan(args.out_dir, scan_distances(args.distances), args.states,
+                          args.jobiph, args.transitions, args.seed)
+    print(f"Zapisano {len(paths)} plików do {args.out_dir}")
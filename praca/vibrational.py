@@ -0,0 +1,180 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+from pes_scan import PESScan
+from database import save_vibrational_levels
+from spectroscopy import fit_spectroscopic_constants, O2_REDUCED_MASS, DISTANCE_SCALE
+
+# Przeliczniki jednostek atomowych
+BOHR_ANGSTROM = 0.529177210903
+AMU_ELECTRON_MASSES = 1822.888486209
+HARTREE_CM = 219474.6313632
+
+# Siatka DVR w R [Å]; krok ~0.017 Å wystarcza do energii kinetycznej ~0.3 Hartree
+GRID_POINTS = 300
+GRID_R_MAX = 6.0
+# Najwięcej poziomów na stan zapisywanych do bazy
+MAX_LEVELS = 40
+# Liczba krzywych diagonalizowanych naraz (pamięć: STATE_CHUNK × GRID_POINTS² liczb)
+STATE_CHUNK = 32
+
+def sinc_dvr_kinetic(n_points, step, mass):
+    """Macierz energii kinetycznej sinc-DVR (Colbert–Miller) w jednostkach atomowych."""
+    i = np.arange(n_points)
+    diff = i[:, None] - i[None, :]
+    with np.errstate(divide='ignore'):
+        t = 2.0 * (-1.0) ** diff / diff ** 2
+    t[i, i] = np.pi ** 2 / 3
+    return t / (2 * mass * step ** 2)
+
+def solve_levels(r_grid, potentials, reduced_mass=O2_REDUCED_MASS, max_levels=MAX_LEVELS,
+                 cutoffs=None, state_chunk=STATE_CHUNK):
+    """Poziomy oscylacyjne wielu krzywych jedną (porcjowaną) diagonalizacją eigh.
+
+    r_grid to równomierna siatka R [Å], potentials (n_grid, n_curves) to
+    energie [Hartree] na tej siatce. Hamiltoniany wszystkich krzywych
+    (T + diag V) tworzą stos (n_curves, n_grid, n_grid) diagonalizowany
+    przez np.linalg.eigh. Poziomy powyżej cutoffs (energia dysocjacji lub
+    brzeg siatki) dostają NaN. Zwraca (energie (n_curves, max_levels),
+    wektory (n_curves, n_grid, max_levels)).
+    """
+    n_grid, n_curves = potentials.shape
+    step = (r_grid[1] - r_grid[0]) / BOHR_ANGSTROM
+    kinetic = sinc_dvr_kinetic(n_grid, step, reduced_mass * AMU_ELECTRON_MASSES)
+    n_levels = min(max_levels, n_grid)
+    if cutoffs is None:
+        cutoffs = potentials[-1]
+
+    energies = np.full((n_curves, n_levels), np.nan)
+    vectors = np.zeros((n_curves, n_grid, n_levels))
+    diagonal = np.arange(n_grid)
+    for start in range(0, n_curves, state_chunk):
+        chunk = potentials[:, start:start + state_chunk].T
+        # Przesunięcie o minimum poprawia uwarunkowanie (energie ~ -150 Hartree)
+        shift = chunk.min(axis=1)
+        hamiltonian = np.repeat(kinetic[None], len(chunk), axis=0)
+        hamiltonian[:, diagonal, diagonal] += chunk - shift[:, None]
+        values, vecs = np.linalg.eigh(hamiltonian)
+        values = values[:, :n_levels] + shift[:, None]
+        bound = values < cutoffs[start:start + state_chunk, None]
+        energies[start:start + len(chunk)] = np.where(bound, values, np.nan)
+        vectors[start:start + len(chunk)] = vecs[:, :, :n_levels] * bound[:, None, :]
+    return energies, vectors
+
+def empty_solution(max_levels=MAX_LEVELS):
+    """Rozwiązanie bez stanów (za mało odległości lub brak stanów wiążących)."""
+    return {
+        'r_grid': np.empty(0),
+        'state_nums': np.empty(0, dtype=np.int64),
+        'order_index': np.empty(0, dtype=np.int64),
+        'energies': np.empty((0, max_levels)),
+        'vectors': np.empty((0, 0, max_levels)),
+    }
+
+def solve_scan(scan: PESScan, states=None, grid_points=GRID_POINTS, r_max=GRID_R_MAX,
+               reduced_mass=O2_REDUCED_MASS, max_levels=MAX_LEVELS,
+               distance_scale=DISTANCE_SCALE):
+    """Poziomy oscylacyjne wszystkich stanów wiążących skanu.
+
+    Krzywe (kolumny skanu, z ich order_index) są interpolowane splajnem
+    kubicznym na równomierną siatkę R = distance_scale · odległość od
+    początku skanu do r_max [Å]. Poziom jest związany, gdy leży poniżej
+    energii w największej odległości skanu i poniżej potencjału na brzegu
+    siatki; stany bez żadnego poziomu związanego są pomijane. Zwraca
+    słownik z siatką, numerami stanów, order_index, energiami
+    (n_stanów, max_levels) i wektorami własnymi; przy mniej niż dwóch
+    odległościach lub braku stanów wiążących – empty_solution.
+    """
+    if scan.n_distances < 2:
+        return empty_solution(max_levels)
+    constants = fit_spectroscopic_constants(scan, distance_scale, reduced_mass)
+    columns = np.flatnonzero(constants['bound'])
+    if states is not None:
+        columns = columns[np.isin(scan.state_nums[columns], states)]
+    if len(columns) == 0:
+        return empty_solution(max_levels)
+
+    r_scan = scan.distances * distance_scale
+    r_grid = np.linspace(r_scan[0], min(r_max, r_scan[-1]), grid_points)
+    potentials = CubicSpline(r_scan, scan.energies[:, columns], axis=0)(r_grid)
+    cutoffs = np.minimum(scan.energies[-1, columns], potentials[-1])
+    energies, vectors = solve_levels(r_grid, potentials, reduced_mass, max_levels, cutoffs)
+    # Stany wiążące wg dopasowania, ale bez poziomu poniżej progu dysocjacji
+    has_levels = ~np.isnan(energies).all(axis=1)
+    return {
+        'r_grid': r_grid,
+        'state_nums': scan.state_nums[columns][has_levels],
+        'order_index': scan.order_index[columns][has_levels],
+        'energies': energies[has_levels],
+        'vectors': vectors[has_levels],
+    }
+
+def levels_table(solution):
+    """Spłaszcza rozwiązanie do wierszy tabeli vibrational_levels.
+
+    term_value to G(v) − G(0) [cm^-1], r_mean to <R> [Å].
+    """
+    energies = solution['energies']
+    states, v = np.nonzero(~np.isnan(energies))
+    density = solution['vectors'] ** 2
+    r_mean = np.einsum('g,sgv->sv', solution['r_grid'], density)
+    return {
+        'state_nums': solution['state_nums'][states],
+        'order_index': solution['order_index'][states],
+        'v': v,
+        'energy': energies[states, v],
+        'term_value': (energies[states, v] - energies[states, 0]) * HARTREE_CM,
+        'r_mean': r_mean[states, v],
+    }
+
+def franck_condon_factors(solution, state_a, state_b):
+    """Czynniki Francka–Condona |<v_a|v_b>|² między poziomami dwóch stanów.
+
+    Zwraca macierz (n_poziomów_a, n_poziomów_b) tylko dla poziomów związanych;
+    ValueError, gdy któryś stan nie jest wiążący lub nie ma go w rozwiązaniu.
+    """
+    rows = []
+    for state in (state_a, state_b):
+        row = np.flatnonzero(solution['state_nums'] == state)
+        if len(row) == 0:
+            raise ValueError(f"Stan {state} nie jest wiążący lub nie ma go w skanie")
+        rows.append(int(row[0]))
+    vectors = []
+    for row in rows:
+        n_bound = int((~np.isnan(solution['energies'][row])).sum())
+        if n_bound == 0:
+            raise ValueError(f"Stan {int(solution['state_nums'][row])} nie ma poziomów związanych")
+        vectors.append(solution['vectors'][row, :, :n_bound])
+    return (vectors[0].T @ vectors[1]) ** 2
+
+def update_vibrational_levels(db_name="molcas_results.db", **kwargs):
+    """Liczy poziomy oscylacyjne dla skanu w bazie i zapisuje je do tabeli."""
+    solution = solve_scan(PESScan.from_database(db_name), **kwargs)
+    save_vibrational_levels(levels_table(solution), db_name)
+    return solution
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Poziomy oscylacyjne stanów wiążących (sinc-DVR)")
+    parser.add_argument("--db", default="molcas_results.db")
+    parser.add_argument("--grid-points", type=int, default=GRID_POINTS)
+    parser.add_argument("--r-max", type=float, default=GRID_R_MAX, help="koniec siatki R [Å]")
+    parser.add_argument("--max-levels", type=int, default=MAX_LEVELS)
+    parser.add_argument("--fc", type=int, nargs=2, metavar=("STAN_A", "STAN_B"),
+                        help="wypisz czynniki Francka–Condona dla pary stanów")
+    args = parser.parse_args()
+
+    solution = update_vibrational_levels(args.db, grid_points=args.grid_points,
+                                         r_max=args.r_max, max_levels=args.max_levels)
+    n_bound = (~np.isnan(solution['energies'])).sum(axis=1)
+    print(f"{'Stan':>5} {'order':>6} {'poziomy':>8} {'G(1)-G(0) [cm-1]':>17}")
+    for state, order, n, row in zip(solution['state_nums'], solution['order_index'],
+                                    n_bound, solution['energies']):
+        spacing = (row[1] - row[0]) * HARTREE_CM if n > 1 else np.nan
+        print(f"{state:>5} {order:>6} {n:>8} {spacing:>17.1f}")
+    if args.fc:
+        try:
+            fc = franck_condon_factors(solution, *args.fc)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"\nCzynniki Francka–Condona {args.fc[0]} → {args.fc[1]} (v' = 0..{min(5, fc.shape[0]) - 1}):")
+        print(np.array2string(fc[:5, :8], precision=4, suppress_small=True))
@@ -0,0 +1,230 @@
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from file_parser import is_finished
+from database import (create_database, save_to_database, update_database_with_mapping,
+                      load_manifest, touch_manifest, database_session)
+from main import parse_file_safe, select_changed_files, BATCH_SIZE, IN_FLIGHT_PER_WORKER
+from log_setup import setup_logging, logging_config, verbosity_level, add_logging_arguments
+
+logger = logging.getLogger("watch")
+
+# Co ile sekund sprawdzany jest folder z wynikami
+POLL_INTERVAL = 2.0
+# Wykresy odświeżane są dopiero po tylu sekundach bez nowych plików
+DEBOUNCE = 5.0
+RENDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "symmetry_plotter.py")
+
+class CampaignWatcher:
+    """Przyrostowe wczytywanie wyników trwającej kampanii Molcas.
+
+    Plik jest wczytywany, gdy ma stopkę „Stop Module: rassi”; pliki bez
+    niej są sprawdzane ponownie dopiero po zmianie rozmiaru lub mtime.
+    Manifest wczytanych plików trzymany jest w pamięci (na starcie z bazy).
+    """
+
+    def __init__(self, data_dir, db_name, cache_dir=None, batch_size=BATCH_SIZE,
+                 executor=None, render_output=None, debounce=DEBOUNCE,
+                 max_in_flight=IN_FLIGHT_PER_WORKER):
+        self.data_dir = data_dir
+        self.db_name = db_name
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.executor = executor
+        self.render_output = render_output
+        self.debounce = debounce
+        self.max_in_flight = max_in_flight
+        self.manifest = load_manifest(db_name)
+        self.waiting = {}   # ścieżka -> (rozmiar, mtime) pliku bez stopki lub z błędem
+        self.changed = asyncio.Event()
+        self.render_pending = False
+
+    def ready_files(self):
+        """Nowe lub zmienione pliki z zakończonymi obliczeniami: [(ścieżka, znany SHA-256)]."""
+        paths = sorted(os.path.join(self.data_dir, f) for f in os.listdir(self.data_dir)
+                       if f.endswith(".rassi.output"))
+        ready = []
+        for path in paths:
+            # Plik może zniknąć lub zostać podmieniony między listdir a stat
+            try:
+                changed = select_changed_files([path], self.manifest)
+                if not changed:
+                    continue
+                sha256 = changed[0][1]
+                stat = os.stat(path)
+                key = (stat.st_size, stat.st_mtime)
+                if self.waiting.get(path) == key:
+                    continue
+                if is_finished(path):
+                    self.waiting.pop(path, None)
+                    ready.append((path, sha256))
+                else:
+                    self.waiting[path] = key
+                    logger.debug("Obliczenia trwają: %s", os.path.basename(path),
+                                 extra={'file': path})
+            except FileNotFoundError:
+                self.waiting.pop(path, None)
+        return ready
+
+    async def _parse_ready(self, ready):
+        """Asynchroniczny odpowiednik iter_parsed: (ścieżka, wynik parse) w kolejności plików.
+
+        Zleconych jest naraz najwyżej max_in_flight zadań, więc w pamięci
+        czeka ograniczona liczba wyników także przy pierwszym przebiegu
+        po dużej, istniejącej kampanii.
+        """
+        loop = asyncio.get_running_loop()
+        parse = partial(parse_file_safe, cache_dir=self.cache_dir)
+        tasks = iter(ready)
+        pending = deque()
+        for path, sha256 in islice(tasks, self.max_in_flight):
+            pending.append((path, loop.run_in_executor(self.executor, parse, path, sha256)))
+        while pending:
+            path, future = pending.popleft()
+            for next_path, sha256 in islice(tasks, 1):
+                pending.append((next_path, loop.run_in_executor(self.executor, parse,
+                                                                next_path, sha256)))
+            yield path, await future
+
+    def _save_batch(self, batch, distances):
+        save_to_database(batch, self.db_name)
+        distances.extend(results['distance'] for results in batch)
+        batch.clear()
+
+    async def poll_once(self):
+        """Wczytuje gotowe pliki i mapuje stany w ich odległościach; zwraca te odległości.
+
+        Wyniki zapisywane są partiami po batch_size w miarę parsowania.
+        """
+        ready = self.ready_files()
+        if not ready:
+            return []
+
+        batch, unchanged, distances = [], [], []
+        async for path, (results, fingerprint, error) in self._parse_ready(ready):
+            if error is not None:
+                logger.error("Błąd w %s: %s", os.path.basename(path), error, extra={'file': path})
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    self.waiting[path] = (stat.st_size, stat.st_mtime)
+                continue
+            self.manifest[fingerprint['path']] = (fingerprint['size'], fingerprint['mtime'],
+                                                  fingerprint['sha256'])
+            if results is None:
+                unchanged.append(fingerprint)
+                continue
+            batch.append(results)
+            if len(batch) >= self.batch_size:
+                self._save_batch(batch, distances)
+        if batch:
+            self._save_batch(batch, distances)
+
+        if unchanged:
+            touch_manifest(unchanged, self.db_name)
+        if distances:
+            update_database_with_mapping(self.db_name, distances)
+            logger.info("Wczytano %d nowych geometrii", len(distances),
+                        extra={'distances': distances})
+            self.render_pending = True
+            self.changed.set()
+        return distances
+
+    async def render(self):
+        """Rysuje wykresy w osobnym procesie (pętla zdarzeń nie jest blokowana)."""
+        self.render_pending = False
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, RENDER_SCRIPT, "--db", self.db_name, "--output", self.render_output,
+            "--formats", "png", "--headless",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        _, stderr = await process.communicate()
+        if process.returncode:
+            logger.error("Rysowanie wykresów nie powiodło się: %s",
+                         stderr.decode(errors='replace').strip())
+        else:
+            logger.info("Wykresy odświeżone: %s.png", self.render_output)
+
+    async def render_loop(self):
+        """Odświeża wykresy, gdy przez debounce sekund nie przyszły nowe pliki."""
+        while True:
+            await self.changed.wait()
+            while True:
+                self.changed.clear()
+                try:
+                    await asyncio.wait_for(self.changed.wait(), self.debounce)
+                except asyncio.TimeoutError:
+                    break
+            await self.render()
+
+async def watch(data_dir, db_name, interval=POLL_INTERVAL, workers=1, cache_dir=None,
+                batch_size=BATCH_SIZE, render_output=None, debounce=DEBOUNCE, max_polls=None):
+    """Co interval sekund wczytuje zakończone pliki z data_dir do bazy.
+
+    render_output (nazwa pliku bez rozszerzenia) włącza odświeżanie wykresu
+    symmetry_plotter z opóźnieniem debounce. max_polls ogranicza liczbę
+    przebiegów (None = do przerwania).
+    """
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=setup_logging,
+                                       initargs=logging_config())
+    watcher = CampaignWatcher(data_dir, db_name, cache_dir, batch_size, executor,
+                              render_output, debounce, max(workers, 1) * IN_FLIGHT_PER_WORKER)
+    renderer = asyncio.create_task(watcher.render_loop()) if render_output else None
+    loop = asyncio.get_running_loop()
+    logger.info("Obserwuję '%s' (co %.1f s)", data_dir, interval)
+
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            started = loop.time()
+            await watcher.poll_once()
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+        # Zakończenie po max_polls: zaległe wykresy rysujemy od razu
+        if renderer is not None and watcher.render_pending:
+            renderer.cancel()
+            await watcher.render()
+    finally:
+        if renderer is not None:
+            renderer.cancel()
+        if executor is not None:
+            executor.shutdown()
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Tryb obserwacji: przyrostowe wczytywanie wyników trwającej kampanii.")
+    parser.add_argument("--data-dir", default="dane", help="folder z plikami .rassi.output")
+    parser.add_argument("--db", default="molcas_results.db", help="plik bazy SQLite")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="liczba procesów parsujących")
+    parser.add_argument("--cache-dir", default=None, help="folder binarnego cache wyników parsera")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help="odstęp między sprawdzeniami folderu (s)")
+    parser.add_argument("--render", metavar="WYKRES", default=None,
+                        help="odświeżaj wykres krzywych (nazwa pliku bez rozszerzenia)")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE,
+                        help="wykres po tylu sekundach bez nowych plików")
+    parser.add_argument("--once", action="store_true",
+                        help="jeden przebieg (np. do skryptów) zamiast ciągłej obserwacji")
+    add_logging_arguments(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(verbosity_level(args.verbose, args.quiet), args.log_json)
+    create_database(args.db)
+    try:
+        with database_session(args.db):
+            asyncio.run(watch(args.data_dir, args.db, args.interval, args.workers,
+                              args.cache_dir, args.batch_size, args.render, args.debounce,
+                              1 if args.once else None))
+    except KeyboardInterrupt:
+        logger.info("Obserwacja zatrzymana")